@@ -0,0 +1,229 @@
+# Benchmark-relative analytics (alpha, beta, information ratio, rolling correlation, drawdowns) in batch over runs
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.database import DB_PATH, read_frame
+from repository.price_store import load_prices, refresh_prices
+
+# === CONFIGURATION === #
+BENCHMARK = "SPY"
+BENCHMARK_FIELD = "Adj Close"
+PERIODS_PER_YEAR = 252
+ROLLING_WINDOW = 63  # ~3 months of daily bars
+EQUITY_TABLE = "equity_curve"
+
+# Every function takes equity as a (T, R) matrix: one column per run or ticker on a shared calendar of T bars,
+# NaN where a column has no value yet. Metrics come back as length-R arrays, so 10,000 sweep results are one pass.
+
+
+# === INPUTS === #
+def load_equity_matrix(labels=None, start=None, end=None, db_path=DB_PATH):
+    """
+    (days, equity, labels) from the equity_curve table in a single query, each label taken from its latest run
+    only (a row dated on or before the label's previous row starts a new run, as in the chart service), so
+    earlier runs under the same label are never spliced in. Dates missing for a label stay NaN.
+    """
+    where, params = "", []
+    if labels:
+        where = f"WHERE ticker IN ({','.join('?' * len(labels))})"
+        params.extend(labels)
+    params += [str(start)[:10] if start is not None else '0000-00-00',
+               str(end)[:10] if end is not None else '9999-99-99']
+    df = read_frame(f"""
+        WITH marked AS (
+            SELECT id, ticker, date, equity,
+                   CASE WHEN date <= LAG(date) OVER (PARTITION BY ticker ORDER BY id) THEN 1 ELSE 0 END AS restart
+            FROM {EQUITY_TABLE} {where}
+        ), runs AS (
+            SELECT ticker, date, equity, SUM(restart) OVER (PARTITION BY ticker ORDER BY id) AS run FROM marked
+        ), latest AS (
+            SELECT ticker, date, equity, run, MAX(run) OVER (PARTITION BY ticker) AS last_run FROM runs
+        )
+        SELECT ticker, date, equity FROM latest
+        WHERE run = last_run AND date >= ? AND date <= ?
+    """, params, db_path)
+
+    labels = list(labels) if labels else sorted(df['ticker'].unique())
+    days, rows = np.unique(pd.to_datetime(df['date']).values.astype('datetime64[D]').astype(np.int64),
+                           return_inverse=True)
+    cols = pd.Index(labels).get_indexer(df['ticker'])
+    equity = np.full((len(days), len(labels)), np.nan)
+    equity[rows[cols >= 0], cols[cols >= 0]] = df['equity'].to_numpy(dtype=float)[cols >= 0]
+    return days, equity, labels
+
+
+def align_benchmark(days, bench_days, bench_prices):
+    """ Benchmark price on each of `days`: the last close on or before that day, NaN before its history starts """
+    if len(bench_days) == 0:
+        return np.full(len(days), np.nan)
+    idx = np.searchsorted(bench_days, days, side='right') - 1
+    prices = np.asarray(bench_prices, dtype=float)[np.maximum(idx, 0)]
+    return np.where(idx >= 0, prices, np.nan)
+
+
+def load_benchmark(days, benchmark=BENCHMARK, field=BENCHMARK_FIELD, db_path=DB_PATH, refresh=False):
+    """ Benchmark prices from the local price store aligned to an epoch-day calendar """
+    start, end = (str(np.datetime64(int(day), 'D')) for day in (days[0], days[-1]))
+    if refresh:
+        refresh_prices(benchmark, start, db_path=db_path)
+    df = load_prices(benchmark, end=end, db_path=db_path)
+    bench_days = df.index.values.astype('datetime64[D]').astype(np.int64)
+    return align_benchmark(days, bench_days, df[field].to_numpy(dtype=float))
+
+
+def simple_returns(values):
+    """ Bar-over-bar returns of a (T,) or (T, R) array; the first bar and bars next to a gap are NaN """
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[1:] = values[1:] / values[:-1] - 1
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+# === RELATIVE METRICS === #
+def relative_metrics(returns, bench_returns, periods_per_year=PERIODS_PER_YEAR, risk_free=0.0):
+    """
+    Alpha (annualized Jensen's alpha), beta, correlation, tracking error and information ratio for every column of
+    `returns` against `bench_returns`, using only the bars where both are defined.
+    """
+    returns = np.asarray(returns, dtype=float)
+    bench = np.broadcast_to(np.asarray(bench_returns, dtype=float)[:, None], returns.shape)
+    mask = np.isfinite(returns) & np.isfinite(bench)
+    n = mask.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.where(mask, returns, 0.0)
+        b = np.where(mask, bench, 0.0)
+        mean_r = r.sum(axis=0) / n
+        mean_b = b.sum(axis=0) / n
+        dr = np.where(mask, returns - mean_r, 0.0)
+        db = np.where(mask, bench - mean_b, 0.0)
+        cov = (dr * db).sum(axis=0) / n
+        var_r = (dr * dr).sum(axis=0) / n
+        var_b = (db * db).sum(axis=0) / n
+
+        active = np.where(mask, returns - bench, 0.0)
+        mean_active = active.sum(axis=0) / n
+        tracking = np.sqrt((np.where(mask, active - mean_active, 0.0) ** 2).sum(axis=0) / n)
+
+        beta = cov / var_b
+        rf = risk_free / periods_per_year
+        return {
+            'alpha': (mean_r - rf - beta * (mean_b - rf)) * periods_per_year,
+            'beta': beta,
+            'correlation': cov / np.sqrt(var_r * var_b),
+            'tracking_error': tracking * np.sqrt(periods_per_year),
+            'information_ratio': mean_active / tracking * np.sqrt(periods_per_year),
+            'observations': n,
+        }
+
+
+def rolling_correlation(returns, bench_returns, window=ROLLING_WINDOW):
+    """
+    (T, R) correlation of each column with the benchmark over a trailing `window` of bars, from windowed
+    cumulative sums (O(T * R) whatever the window). NaN until a window has `window` joint observations.
+    """
+    returns = np.asarray(returns, dtype=float)
+    bench = np.broadcast_to(np.asarray(bench_returns, dtype=float)[:, None], returns.shape)
+    mask = np.isfinite(returns) & np.isfinite(bench)
+    x = np.where(mask, returns, 0.0)
+    y = np.where(mask, bench, 0.0)
+
+    def window_sum(a):
+        total = np.cumsum(a, axis=0)
+        total[window:] -= total[:-window].copy()
+        return total
+
+    n = window_sum(mask.astype(float))
+    sx, sy = window_sum(x), window_sum(y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = window_sum(x * y) - sx * sy / n
+        var_x = window_sum(x * x) - sx * sx / n
+        var_y = window_sum(y * y) - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[n < window] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+# === DRAWDOWNS === #
+def drawdown_summary(equity):
+    """
+    Per column: max drawdown with its peak / trough / recovery bar (-1 if not recovered), longest time under
+    water in bars, number of drawdown periods and the drawdown on the last bar.
+    """
+    equity = np.asarray(equity, dtype=float)
+    if equity.ndim == 1:
+        equity = equity[:, None]
+    n_bars, n_cols = equity.shape
+    cols = np.arange(n_cols)
+    bars = np.arange(n_bars)[:, None]
+
+    peak = np.fmax.accumulate(equity, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = 1 - equity / peak
+    valid = np.isfinite(drawdown)
+    under = valid & (drawdown > 0)
+    at_high = valid & ~under
+
+    last_high = np.maximum.accumulate(np.where(at_high, bars, -1), axis=0)
+    next_high = np.flip(np.minimum.accumulate(np.flip(np.where(at_high, bars, n_bars), axis=0), axis=0), axis=0)
+    streak = np.where(under, bars - last_high, 0)
+    starts = under & ~np.vstack([np.zeros((1, n_cols), dtype=bool), under[:-1]])
+
+    trough = np.argmax(np.where(valid, drawdown, -np.inf), axis=0)
+    recovery = next_high[trough, cols]
+    return {
+        'max_drawdown': np.where(valid.any(axis=0), drawdown[trough, cols], np.nan),
+        'peak_bar': last_high[trough, cols],
+        'trough_bar': trough,
+        'recovery_bar': np.where(recovery < n_bars, recovery, -1),
+        'longest_underwater_bars': streak.max(axis=0),
+        'drawdown_periods': starts.sum(axis=0),
+        'current_drawdown': drawdown[-1],
+    }
+
+
+# === PIPELINE === #
+def benchmark_report(days, equity, labels, benchmark_prices, window=ROLLING_WINDOW,
+                     periods_per_year=PERIODS_PER_YEAR):
+    """ One row per equity column with its benchmark-relative metrics and drawdown profile """
+    returns = simple_returns(equity)
+    bench_returns = simple_returns(benchmark_prices)
+    relative = relative_metrics(returns, bench_returns, periods_per_year)
+    rolling = rolling_correlation(returns, bench_returns, window)
+    drawdowns = drawdown_summary(equity)
+
+    report = pd.DataFrame({'label': labels, **relative, **drawdowns})
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # columns with no full window yet
+        report['rolling_corr_mean'] = np.nanmean(rolling, axis=0)
+        report['rolling_corr_min'] = np.nanmin(rolling, axis=0)
+    for column in ('peak_bar', 'trough_bar', 'recovery_bar'):
+        bars = report[column].to_numpy()
+        report[column.replace('_bar', '_date')] = [
+            str(np.datetime64(int(days[bar]), 'D')) if bar >= 0 else None for bar in bars
+        ]
+    return report
+
+
+# === MAIN === #
+if __name__ == "__main__":
+    days, equity, labels = load_equity_matrix()
+    if not labels:
+        print("⚠️ No equity curves stored yet")
+    else:
+        try:
+            bench = load_benchmark(days, refresh=True)
+        except Exception as e:
+            print(f"⚠️ Could not refresh {BENCHMARK}, using stored prices: {e}")
+            bench = load_benchmark(days)
+        report = benchmark_report(days, equity, labels, bench)
+        pd.set_option('display.width', 200)
+        print(report[['label', 'alpha', 'beta', 'information_ratio', 'correlation', 'rolling_corr_mean',
+                      'max_drawdown', 'peak_date', 'trough_date', 'recovery_date', 'longest_underwater_bars']])
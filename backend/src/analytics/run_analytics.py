@@ -0,0 +1,457 @@
+# Cross-run analytics layer: numeric trade facts, per-run / per-ticker summaries and cached queries
+import json
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.database import DB_PATH, connect
+
+# === CONFIGURATION === #
+TRADE_TABLE = "backtestv1"
+TRADE_COLUMNS = ('datetime', 'ticker', 'buy_price', 'sell_price', 'size', 'pnl', 'cash_after_trade', 'time_held')
+FACT_TABLE = "trade_facts"
+RUN_TABLE = "run_summary"
+TICKER_TABLE = "ticker_summary"
+META_TABLE = "analytics_meta"
+SCHEMA_VERSION = 2  # bump when a view changes so existing databases recreate it
+LEGACY_STRATEGY = "legacy_import"
+QUERY_CACHE_SIZE = 256
+# runs that span a whole history; incremental_backtest's nightly segments only cover the appended bars
+FULL_RUN = "COALESCE(json_extract({alias}params, '$.mode'), '') != 'incremental'"
+
+EPOCH = date(1970, 1, 1)
+RUN_METRICS = ('sharpe', 'sortino', 'calmar', 'max_drawdown', 'total_return', 'final_value', 'win_rate', 'n_trades')
+TIME_HELD_PATTERN = re.compile(r"^(?:(-?\d+) days?, )?(\d+):(\d{2}):(\d{2}(?:\.\d+)?)$")
+
+# === SCHEMA === #
+# Dates are stored as days since 1970-01-01 and durations as seconds so they can be indexed and aggregated in SQL.
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {RUN_TABLE} (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        strategy TEXT NOT NULL,
+        params TEXT NOT NULL,
+        tickers TEXT NOT NULL,
+        start_day INTEGER,
+        end_day INTEGER,
+        initial_value REAL,
+        final_value REAL,
+        total_return REAL,
+        sharpe REAL,
+        sortino REAL,
+        calmar REAL,
+        max_drawdown REAL,
+        n_trades INTEGER NOT NULL DEFAULT 0,
+        win_rate REAL,
+        created_at INTEGER NOT NULL
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {FACT_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id INTEGER NOT NULL REFERENCES {RUN_TABLE}(run_id),
+        legacy_id INTEGER UNIQUE,
+        ticker TEXT NOT NULL,
+        entry_day INTEGER,
+        exit_day INTEGER NOT NULL,
+        held_seconds INTEGER,
+        buy_price REAL,
+        sell_price REAL,
+        size INTEGER,
+        pnl REAL,
+        return_pct REAL,
+        cash_after_trade REAL
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {TICKER_TABLE} (
+        run_id INTEGER NOT NULL REFERENCES {RUN_TABLE}(run_id),
+        ticker TEXT NOT NULL,
+        n_trades INTEGER NOT NULL,
+        n_wins INTEGER NOT NULL,
+        total_pnl REAL,
+        avg_return_pct REAL,
+        avg_held_seconds REAL,
+        best_pnl REAL,
+        worst_pnl REAL,
+        PRIMARY KEY (run_id, ticker)
+    )
+    """,
+    f"CREATE INDEX IF NOT EXISTS idx_{FACT_TABLE}_run ON {FACT_TABLE} (run_id)",
+    f"CREATE INDEX IF NOT EXISTS idx_{FACT_TABLE}_ticker_pnl ON {FACT_TABLE} (ticker, pnl)",
+    f"CREATE INDEX IF NOT EXISTS idx_{FACT_TABLE}_exit_day ON {FACT_TABLE} (exit_day)",
+    f"CREATE INDEX IF NOT EXISTS idx_{RUN_TABLE}_sharpe ON {RUN_TABLE} (sharpe)",
+    f"CREATE INDEX IF NOT EXISTS idx_{TICKER_TABLE}_ticker ON {TICKER_TABLE} (ticker)",
+]
+
+# name -> SELECT; recreated whenever the stored schema version is older than SCHEMA_VERSION
+VIEWS = {
+    # run_summary.sharpe is the portfolio's, so only single-ticker runs say anything about one ticker,
+    # and a nightly segment's Sharpe only covers a few bars
+    'v_best_sharpe_per_ticker': f"""
+    SELECT r.tickers AS ticker, r.run_id, r.strategy, r.params, MAX(r.sharpe) AS sharpe,
+           COALESCE(t.n_trades, 0) AS n_trades, t.total_pnl
+    FROM {RUN_TABLE} r LEFT JOIN {TICKER_TABLE} t ON t.run_id = r.run_id AND t.ticker = r.tickers
+    WHERE r.sharpe IS NOT NULL AND instr(r.tickers, ',') = 0 AND {FULL_RUN.format(alias='r.')}
+    GROUP BY r.tickers
+    """,
+    'v_trade_facts': f"""
+    SELECT f.*, f.held_seconds / 86400.0 AS held_days,
+           date(f.exit_day * 86400, 'unixepoch') AS exit_date,
+           date(f.entry_day * 86400, 'unixepoch') AS entry_date,
+           f.pnl > 0 AS is_win
+    FROM {FACT_TABLE} f
+    """,
+    'v_ticker_totals': f"""
+    SELECT ticker, COUNT(*) AS runs, SUM(n_trades) AS n_trades, SUM(n_wins) AS n_wins,
+           SUM(total_pnl) AS total_pnl,
+           SUM(avg_held_seconds * n_trades) / SUM(n_trades) / 86400.0 AS avg_held_days
+    FROM {TICKER_TABLE}
+    GROUP BY ticker
+    """,
+}
+
+
+_schema_ready = set()
+
+
+def connect_db(db_path=DB_PATH):
+    """ Open a connection with the analytics schema in place (created once per process) """
+    conn = connect(db_path)
+    if db_path not in _schema_ready:
+        ensure_schema(conn)
+        _schema_ready.add(db_path)
+    return conn
+
+
+def ensure_schema(conn):
+    """
+    Create or upgrade the schema in one write transaction: concurrent workers connecting for the first time
+    queue on the lock, and all but the first find the schema version already current.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        meta = dict(conn.execute(f"SELECT key, value FROM {META_TABLE}").fetchall())
+        if meta.get('schema_version', 0) < SCHEMA_VERSION:
+            fresh = not table_exists(conn, RUN_TABLE)
+            for statement in SCHEMA:
+                conn.execute(statement)
+            for name, select in VIEWS.items():
+                conn.execute(f"DROP VIEW IF EXISTS {name}")
+                conn.execute(f"CREATE VIEW {name} AS {select}")
+            if 'legacy_cutoff' not in meta:
+                meta['legacy_cutoff'] = legacy_cutoff(conn, fresh)
+            meta['schema_version'] = SCHEMA_VERSION
+            conn.executemany(f"INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (?, ?)", meta.items())
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def legacy_cutoff(conn, fresh):
+    """
+    Last backtestv1 id written before the analytics layer, i.e. the rows backfill_legacy_trades() may import;
+    later rows come from runs that record_run() stores itself. A database whose analytics tables predate the
+    cutoff can't tell the two apart once it holds recorded runs, so it keeps what was already imported.
+    """
+    if not table_exists(conn, TRADE_TABLE):
+        return 0
+    recorded = not fresh and conn.execute(
+        f"SELECT 1 FROM {RUN_TABLE} WHERE strategy != ? LIMIT 1", (LEGACY_STRATEGY,)
+    ).fetchone() is not None
+    if recorded:
+        return conn.execute(f"SELECT COALESCE(MAX(legacy_id), 0) FROM {FACT_TABLE}").fetchone()[0]
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {TRADE_TABLE}").fetchone()[0]
+
+
+# === CONVERSIONS === #
+def to_epoch_day(value):
+    """ Convert a date, datetime or 'YYYY-MM-DD' string to days since 1970-01-01 """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], '%Y-%m-%d')
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def parse_time_held(text):
+    """ Convert a str(timedelta) such as '155 days, 0:00:00' to whole seconds """
+    if text is None:
+        return None
+    match = TIME_HELD_PATTERN.match(text.strip())
+    if not match:
+        return None
+    days, hours, minutes, seconds = match.groups()
+    return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+
+
+def make_trade_fact(ticker, buy_datetime, sell_datetime, buy_price, sell_price, size, pnl, cash_after_trade):
+    """ Build the numeric trade record that record_run() stores """
+    return_pct = round((sell_price - buy_price) / buy_price * 100, 4) if buy_price else None
+    return (
+        ticker,
+        to_epoch_day(buy_datetime),
+        to_epoch_day(sell_datetime),
+        int((sell_datetime - buy_datetime).total_seconds()),
+        buy_price,
+        sell_price,
+        size,
+        pnl,
+        return_pct,
+        cash_after_trade,
+    )
+
+
+def trade_rows(trades):
+    """ backtestv1 rows (TRADE_COLUMNS) of trade facts: exit date and str(timedelta) held, as the strategies log them """
+    return [
+        (str(EPOCH + timedelta(days=exit_day)), ticker, buy_price, sell_price, size, pnl, cash_after_trade,
+         str(timedelta(seconds=held_seconds)))
+        for ticker, _, exit_day, held_seconds, buy_price, sell_price, size, pnl, _, cash_after_trade in trades
+    ]
+
+
+# === METRICS === #
+def compute_equity_metrics(values, periods_per_year=252):
+    """ Sharpe / Sortino / Calmar / drawdown from an equity series, same formulas as the strategies' stop() """
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return {}
+
+    returns = np.diff(values) / values[:-1]
+    avg_return = np.mean(returns)
+    std_dev = np.std(returns)
+    negatives = returns[returns < 0]
+    downside_dev = np.std(negatives) if len(negatives) else 0.0
+    max_drawdown = np.max(1 - values / np.maximum.accumulate(values))
+
+    return {
+        'sharpe': float((avg_return / std_dev) * np.sqrt(periods_per_year)) if std_dev > 0 else 0.0,
+        'sortino': float((avg_return / downside_dev) * np.sqrt(periods_per_year)) if downside_dev > 0 else 0.0,
+        'calmar': float((values[-1] - values[0]) / values[0] / max_drawdown) if max_drawdown > 0 else 0.0,
+        'max_drawdown': float(max_drawdown),
+        'total_return': float((values[-1] - values[0]) / values[0]),
+        'initial_value': float(values[0]),
+        'final_value': float(values[-1]),
+    }
+
+
+def summarize_trades_by_ticker(trades):
+    """ Aggregate trade facts into one ticker_summary row per ticker """
+    summary = {}
+    for ticker, _, _, held_seconds, _, _, _, pnl, return_pct, _ in trades:
+        row = summary.setdefault(ticker, {'n': 0, 'wins': 0, 'pnl': [], 'ret': [], 'held': []})
+        row['n'] += 1
+        row['wins'] += pnl > 0
+        row['pnl'].append(pnl)
+        if return_pct is not None:
+            row['ret'].append(return_pct)
+        if held_seconds is not None:
+            row['held'].append(held_seconds)
+
+    return [
+        (
+            ticker,
+            row['n'],
+            row['wins'],
+            round(sum(row['pnl']), 2),
+            float(np.mean(row['ret'])) if row['ret'] else None,
+            float(np.mean(row['held'])) if row['held'] else None,
+            max(row['pnl']),
+            min(row['pnl']),
+        )
+        for ticker, row in summary.items()
+    ]
+
+
+# === INCREMENTAL UPDATE === #
+def record_run(strategy, params, tickers, dates, equity_values, trades, db_path=DB_PATH, conn=None):
+    """
+    Store one finished run: a run_summary row, its trade facts and per-ticker summaries.
+    Only the rows for this run are written, existing summaries are never recomputed.
+    Returns the new run_id.
+    """
+    metrics = compute_equity_metrics(equity_values)
+    wins = sum(1 for t in trades if t[7] > 0)
+    own_conn = conn is None
+    conn = conn or connect_db(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO {RUN_TABLE} (strategy, params, tickers, start_day, end_day, initial_value, final_value,
+                                     total_return, sharpe, sortino, calmar, max_drawdown, n_trades, win_rate, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            strategy,
+            json.dumps(params, sort_keys=True),
+            ','.join(tickers),
+            to_epoch_day(dates[0]) if len(dates) else None,
+            to_epoch_day(dates[-1]) if len(dates) else None,
+            metrics.get('initial_value'),
+            metrics.get('final_value'),
+            metrics.get('total_return'),
+            metrics.get('sharpe'),
+            metrics.get('sortino'),
+            metrics.get('calmar'),
+            metrics.get('max_drawdown'),
+            len(trades),
+            wins / len(trades) if trades else None,
+            int(time.time()),
+        ))
+        run_id = cursor.lastrowid
+
+        cursor.executemany(f"""
+            INSERT INTO {FACT_TABLE} (run_id, ticker, entry_day, exit_day, held_seconds, buy_price, sell_price,
+                                      size, pnl, return_pct, cash_after_trade)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(run_id,) + tuple(t) for t in trades])
+        cursor.executemany(f"""
+            INSERT INTO {TICKER_TABLE} (run_id, ticker, n_trades, n_wins, total_pnl, avg_return_pct,
+                                        avg_held_seconds, best_pnl, worst_pnl)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(run_id,) + row for row in summarize_trades_by_ticker(trades)])
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    return run_id
+
+
+def backfill_legacy_trades(db_path=DB_PATH):
+    """
+    Import backtestv1 rows written before the analytics layer (up to the stored legacy cutoff) and not converted
+    yet into trade_facts, under a single legacy run. Later rows already are trade facts of their recorded run.
+    """
+    conn = connect_db(db_path)
+    try:
+        rows = conn.execute(f"""
+            SELECT id, datetime, ticker, buy_price, sell_price, size, pnl, cash_after_trade, time_held
+            FROM {TRADE_TABLE}
+            WHERE id > (SELECT COALESCE(MAX(legacy_id), 0) FROM {FACT_TABLE})
+              AND id <= (SELECT value FROM {META_TABLE} WHERE key = 'legacy_cutoff')
+            ORDER BY id
+        """).fetchall()
+        if not rows:
+            return 0
+
+        trades, legacy_ids = [], []
+        for legacy_id, exit_date, ticker, buy_price, sell_price, size, pnl, cash, time_held in rows:
+            exit_day = to_epoch_day(exit_date)
+            held_seconds = parse_time_held(time_held)
+            entry_day = exit_day - held_seconds // 86400 if held_seconds is not None else None
+            return_pct = round((sell_price - buy_price) / buy_price * 100, 4) if buy_price else None
+            trades.append((ticker, entry_day, exit_day, held_seconds, buy_price, sell_price, size, pnl, return_pct, cash))
+            legacy_ids.append(legacy_id)
+
+        run_id = record_run(LEGACY_STRATEGY, {}, sorted({t[0] for t in trades}), [], [], trades, conn=conn)
+        conn.executemany(f"""
+            UPDATE {FACT_TABLE} SET legacy_id = ?
+            WHERE id = (SELECT MIN(id) FROM {FACT_TABLE} WHERE run_id = ? AND legacy_id IS NULL)
+        """, [(legacy_id, run_id) for legacy_id in legacy_ids])
+        conn.commit()
+        return len(trades)
+    finally:
+        conn.close()
+
+
+# === CACHED QUERY API === #
+def data_version(db_path=DB_PATH):
+    """ Highest run_id: cached results stay valid until a new run is recorded """
+    conn = connect_db(db_path)
+    try:
+        return conn.execute(f"SELECT COALESCE(MAX(run_id), 0) FROM {RUN_TABLE}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _cached_query(db_path, version, sql, params):
+    conn = connect_db(db_path)
+    try:
+        cursor = conn.execute(sql, params)
+        columns = tuple(c[0] for c in cursor.description)
+        return columns, tuple(cursor.fetchall())
+    finally:
+        conn.close()
+
+
+def query(sql, params=(), db_path=DB_PATH):
+    """ Run a read-only query, cached per data version """
+    columns, rows = _cached_query(db_path, data_version(db_path), sql, tuple(params))
+    return pd.DataFrame(list(rows), columns=list(columns))
+
+
+def leaderboard(metric='sharpe', limit=20, strategy=None, db_path=DB_PATH):
+    """ Best full runs by `metric`; incremental segments are left out as their metrics only cover the new bars """
+    if metric not in RUN_METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {RUN_METRICS}")
+    where = "strategy = ?" if strategy else f"strategy != '{LEGACY_STRATEGY}'"
+    params = (strategy, limit) if strategy else (limit,)
+    return query(f"""
+        SELECT run_id, strategy, params, tickers, {metric}, final_value, n_trades, win_rate
+        FROM {RUN_TABLE} WHERE {where} AND {FULL_RUN.format(alias='')}
+        ORDER BY {metric} DESC NULLS LAST
+        LIMIT ?
+    """, params, db_path)
+
+
+def best_sharpe_per_ticker(db_path=DB_PATH):
+    """
+    Best single-ticker full run per ticker; multi-ticker runs are left out as their Sharpe is the portfolio's,
+    incremental segments as theirs only covers the appended bars
+    """
+    return query("SELECT * FROM v_best_sharpe_per_ticker ORDER BY sharpe DESC", db_path=db_path)
+
+
+def held_time_distribution(winners=True, bucket_days=7, ticker=None, db_path=DB_PATH):
+    """ Histogram of holding periods, bucketed in SQL: (bucket_start_days, trades) """
+    condition = "pnl > 0" if winners else "pnl <= 0"
+    params = [bucket_days * 86400, bucket_days]
+    if ticker:
+        condition += " AND ticker = ?"
+        params.append(ticker)
+    return query(f"""
+        SELECT (held_seconds / ?) * ? AS bucket_start_days, COUNT(*) AS trades
+        FROM {FACT_TABLE}
+        WHERE held_seconds IS NOT NULL AND {condition}
+        GROUP BY bucket_start_days
+        ORDER BY bucket_start_days
+    """, params, db_path)
+
+
+def compare_runs(run_ids, db_path=DB_PATH):
+    placeholders = ','.join('?' * len(run_ids))
+    return query(f"""
+        SELECT r.run_id, r.strategy, r.params, t.ticker, t.n_trades, t.n_wins, t.total_pnl,
+               t.avg_return_pct, t.avg_held_seconds / 86400.0 AS avg_held_days, r.sharpe, r.max_drawdown
+        FROM {RUN_TABLE} r JOIN {TICKER_TABLE} t ON t.run_id = r.run_id
+        WHERE r.run_id IN ({placeholders})
+        ORDER BY r.run_id, t.ticker
+    """, tuple(run_ids), db_path)
+
+
+def ticker_totals(db_path=DB_PATH):
+    return query("SELECT * FROM v_ticker_totals ORDER BY total_pnl DESC", db_path=db_path)
+
+
+# === MAIN === #
+if __name__ == "__main__":
+    imported = backfill_legacy_trades()
+    print(f"✅ Imported {imported} legacy trades into {FACT_TABLE}")
+    print(ticker_totals())
+    print(held_time_distribution(winners=True))
@@ -1,9 +1,17 @@
 import backtrader as bt
-import yfinance as yf
 import pandas as pd
-import sqlite3
+import logging
+import os
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics.run_analytics import TRADE_COLUMNS, make_trade_fact, record_run, trade_rows
+from equity_curve.equity_buffer import EquityBuffer, feed_calendar
+from middleware.structured_logging import log_event, setup_logging
+from repository.data_panel import get_panel
+from repository.database import DB_PATH, bulk_insert
+
 # === CONFIGURATION === #
 INITIAL_CASH = 100000
 TICKERS = ['AAPL', 'MSFT', 'GOOGL']
@@ -12,9 +20,9 @@ END_DATE = '2025-01-01'
 MAX_POSITION_WEIGHT = 0.5
 
 # === DATABASE === #
-DB_PATH = "stock_datas.db"
 TRADE_TABLE = "backtestv1"
 EQUITY_TABLE = "equity_curve"
+STRATEGY_NAME = "ma_crossover"
 
 # === STRATEGY PARAMETERS === #
 STRATEGY_PARAMS = {
@@ -22,6 +30,20 @@ STRATEGY_PARAMS = {
     'long_period': 50,
 }
 
+# === LOGGING === #
+logger = logging.getLogger("backtest")
+TRADE_CLOSED_MSG = (
+    "\n💰 TRADE CLOSED ({ticker}):\n"
+    "  Bought at:     ${buy_price:.2f}\n"
+    "  Sold at:       ${sell_price:.2f}\n"
+    "  Size:          {size} shares\n"
+    "  PnL:           ${pnl:.2f}\n"
+    "  Return:        {return_pct:.2f}%\n"
+    "  Time Held:     {time_held}\n"
+    "  Cash Balance:  ${cash_after_trade:.2f}"
+)
+ORDER_FAILED_MSG = "⚠️ Order failed for {ticker} ({status})"
+
 # === HELPER: POSITION SIZING FUNCTION === #
 def calculate_order_size(price, cash, max_weight=MAX_POSITION_WEIGHT):
     max_position_value = cash * max_weight
@@ -44,7 +66,8 @@ class MovingAverageCrossoverStrategy(bt.Strategy):
         self.buy_price = None
         self.buy_size = None
         self.buy_datetime = None
-        self.equity_curve = []
+        self.equity_curve = EquityBuffer(self.data.buflen(), 1)
+        self.closed_trades = []
 
     def next(self):
         if self.order:
@@ -63,9 +86,9 @@ class MovingAverageCrossoverStrategy(bt.Strategy):
         elif self.sma_short[0] < self.sma_long[0] and self.sma_short[-1] >= self.sma_long[-1]:
             self.order = self.sell(size=self.buy_size)
 
-        date = self.data.datetime.date(0).strftime('%Y-%m-%d')
-        equity = round(self.broker.getvalue(), 2)
-        self.equity_curve.append((date, self.ticker, equity))
+        self.equity_curve.append(
+            len(self.data) - 1, round(self.broker.getvalue(), 2), self.broker.get_cash(), [self.position.size]
+        )
 
     def notify_order(self, order):
         if order.status == order.Completed:
@@ -79,48 +102,51 @@ class MovingAverageCrossoverStrategy(bt.Strategy):
                 size = abs(round(order.executed.size))
                 buy_price = round(self.buy_price, 2)
                 pnl = round((sell_price - buy_price) * size, 2)
-                trade_return_pct = round(((sell_price - buy_price) / buy_price) * 100, 2) if buy_price else 0.0
                 cash_balance = round(self.broker.get_cash(), 2)
                 sell_datetime = self.data.datetime.datetime(0)
-                time_held = str(sell_datetime - self.buy_datetime)
-                exit_time = sell_datetime.strftime('%Y-%m-%d')
-
-                print(f"\n💰 TRADE CLOSED ({self.ticker}):")
-                print(f"  Bought at:     ${buy_price:.2f}")
-                print(f"  Sold at:       ${sell_price:.2f}")
-                print(f"  Size:          {size} shares")
-                print(f"  PnL:           ${pnl:.2f}")
-                print(f"  Return:        {trade_return_pct:.2f}%")
-                print(f"  Time Held:     {time_held}")
-                print(f"  Cash Balance:  ${cash_balance:.2f}")
-
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
-                cursor.execute(f"""
-                    INSERT INTO {TRADE_TABLE} (datetime, ticker, buy_price, sell_price, size, pnl, cash_after_trade, time_held)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (exit_time, self.ticker, buy_price, sell_price, size, pnl, cash_balance, time_held))
-                conn.commit()
-                conn.close()
+
+                if logger.isEnabledFor(logging.INFO):  # log-only fields are skipped when INFO is off
+                    time_held = str(sell_datetime - self.buy_datetime)
+                    exit_time = sell_datetime.strftime('%Y-%m-%d')
+                    trade_return_pct = round(((sell_price - buy_price) / buy_price) * 100, 2) if buy_price else 0.0
+                    log_event(
+                        logger, logging.INFO, 'trade_closed', TRADE_CLOSED_MSG,
+                        ticker=self.ticker, buy_date=self.buy_datetime.strftime('%Y-%m-%d'), sell_date=exit_time,
+                        buy_price=buy_price, sell_price=sell_price, size=size, pnl=pnl,
+                        return_pct=trade_return_pct, time_held=time_held, cash_after_trade=cash_balance,
+                    )
+
+                self.closed_trades.append(make_trade_fact(
+                    self.ticker, self.buy_datetime, sell_datetime, buy_price, sell_price, size, pnl, cash_balance
+                ))
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            print(f"⚠️ Order failed for {self.ticker}")
+            log_event(
+                logger, logging.WARNING, 'order_failed', ORDER_FAILED_MSG,
+                ticker=self.ticker, status=order.getstatusname(),
+            )
         self.order = None
 
     def stop(self):
         if self.position:
             self.close()
 
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.executemany(f"""
-            INSERT INTO {EQUITY_TABLE} (date, ticker, equity)
-            VALUES (?, ?, ?)
-        """, self.equity_curve)
-        conn.commit()
-        conn.close()
+        bulk_insert(TRADE_TABLE, TRADE_COLUMNS, trade_rows(self.closed_trades), DB_PATH)
+        bulk_insert(EQUITY_TABLE, ('date', 'ticker', 'equity'),
+                    self.equity_curve.rows(feed_calendar(self.data.datetime.array), self.ticker), DB_PATH)
         print(f"📊 Equity curve saved for {self.ticker}")
 
+        run_id = record_run(
+            STRATEGY_NAME,
+            {'short_period': self.params.short_period, 'long_period': self.params.long_period},
+            [self.ticker],
+            self.equity_curve.dates(feed_calendar(self.data.datetime.array)),
+            self.equity_curve.values,
+            self.closed_trades,
+            db_path=DB_PATH,
+        )
+        print(f"🗂️ Run #{run_id} recorded in analytics tables")
+
 # === BACKTRADER DATA WRAPPER === #
 class PandasYahooData(bt.feeds.PandasData):
     params = (
@@ -133,28 +159,14 @@ class PandasYahooData(bt.feeds.PandasData):
         ('openinterest', -1),
     )
 
-# === FETCH AND CLEAN YFINANCE DATA === #
-def fetch_data(ticker, start, end):
-    df = yf.download(
-        ticker,
-        start=start,
-        end=end,
-        progress=False,
-        auto_adjust=False,
-        group_by='ticker'
-    )
-
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = [col[0] for col in df.columns]
-
-    df.columns = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
-    df.index = pd.to_datetime(df.index)
-    df.dropna(inplace=True)
-    return df
+# === FETCH DATA === #
+def fetch_data(tickers, start, end):
+    """ Shared panel of the universe; only bars missing from the local price store are downloaded """
+    return get_panel(tickers, start, pd.Timestamp(end) - pd.Timedelta(days=1), refresh=True)  # end is exclusive
 
 # === RUN BACKTEST === #
-def run_backtest(ticker):
-    df = fetch_data(ticker, START_DATE, END_DATE)
+def run_backtest(ticker, panel):
+    df = panel.frame(ticker)
     if df.empty:
         print(f"❌ No data for {ticker}. Skipping.")
         return
@@ -174,5 +186,7 @@ def run_backtest(ticker):
 
 # === MAIN === #
 if __name__ == '__main__':
+    setup_logging()
+    panel = fetch_data(TICKERS, START_DATE, END_DATE)
     for ticker in TICKERS:
-        run_backtest(ticker)
+        run_backtest(ticker, panel)
@@ -0,0 +1,60 @@
+# Throughput benchmark for the crossover kernel: compiled (numba) vs pure-Python loop on a synthetic universe
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine.crossover_kernel import get_kernel, run_crossover, simulate_bars
+
+# === CONFIGURATION === #
+N_BARS = 5000
+N_TICKERS = 200
+PYTHON_TICKERS = 10  # the Python loop is timed on a slice, it is far too slow for the full universe
+SHORT_PERIOD = 20
+LONG_PERIOD = 50
+SEED = 7
+
+
+def synthetic_panel(n_bars, n_tickers, seed=SEED):
+    """ Random-walk (days, open, close) panel with a mix of trending and choppy tickers """
+    rng = np.random.default_rng(seed)
+    drift = rng.normal(0.0003, 0.0005, n_tickers)
+    close = 100 * np.exp(np.cumsum(rng.normal(drift, 0.02, (n_bars, n_tickers)), axis=0))
+    open_ = close * np.exp(rng.normal(0, 0.01, (n_bars, n_tickers)))
+    days = np.arange(n_bars, dtype=np.int64) + 18262  # 2020-01-01
+    return days, open_, close
+
+
+def timed_run(open_, close, days, jit):
+    start_time = time.perf_counter()
+    result = run_crossover(open_, close, days, SHORT_PERIOD, LONG_PERIOD, jit=jit)
+    return result, time.perf_counter() - start_time
+
+
+def same_result(a, b):
+    return (np.array_equal(a['equity'], b['equity'], equal_nan=True)
+            and all(np.array_equal(a['fills'][key], b['fills'][key]) for key in a['fills']))
+
+
+# === MAIN === #
+if __name__ == '__main__':
+    days, opens, closes = synthetic_panel(N_BARS, N_TICKERS)
+    compiled = get_kernel(True) is not simulate_bars
+    print(f"⚙️ numba {'available' if compiled else 'not installed, both runs use the Python loop'}")
+
+    # first call compiles (or loads the on-disk cache); keep it out of the measurement
+    timed_run(opens[:LONG_PERIOD * 2, :1], closes[:LONG_PERIOD * 2, :1], days[:LONG_PERIOD * 2], jit=True)
+
+    sub = slice(0, PYTHON_TICKERS)
+    py_result, py_seconds = timed_run(opens[:, sub], closes[:, sub], days, jit=False)
+    jit_sub, _ = timed_run(opens[:, sub], closes[:, sub], days, jit=True)
+    assert same_result(py_result, jit_sub), "compiled kernel diverged from the Python kernel"
+
+    jit_result, jit_seconds = timed_run(opens, closes, days, jit=True)
+    py_rate = N_BARS * PYTHON_TICKERS / py_seconds
+    jit_rate = N_BARS * N_TICKERS / jit_seconds
+    print(f"🐍 Python: {N_BARS} bars x {PYTHON_TICKERS} tickers in {py_seconds:.2f}s | {py_rate:,.0f} ticker-bars/s")
+    print(f"🚀 Kernel: {N_BARS} bars x {N_TICKERS} tickers in {jit_seconds:.2f}s | {jit_rate:,.0f} ticker-bars/s "
+          f"| {len(jit_result['fills']['bar'])} fills | x{jit_rate / py_rate:.0f}")
@@ -0,0 +1,371 @@
+# Array-based moving average crossover simulation reproducing the backtrader MovingAverageCrossoverStrategy
+import math
+import os
+
+import numpy as np
+
+from engine.risk_exits import (EXIT_REASONS, EXIT_SIGNAL, exit_table, resume_exits, risk_enabled,
+                               track_open_positions)
+
+# === CONFIGURATION === #
+MAX_POSITION_WEIGHT = 0.5
+BUY = 1
+SELL = -1
+TIE_TOLERANCE = 1e-9  # relative gap under which SMA comparisons are recomputed with math.fsum like backtrader
+USE_JIT = os.getenv("KERNEL_JIT", "1") != "0"  # KERNEL_JIT=0 forces the pure-Python loop even with numba installed
+
+STATE_FIELDS = (
+    'cash', 'pos_size', 'pos_price', 'buy_price', 'buy_size', 'buy_day',
+    'q_ticker', 'q_side', 'q_size', 'q_price', 'q_len',
+    'exit_bar', 'exit_price', 'exit_reason', 'peak', 'held',
+)
+
+
+# === SIGNALS === #
+def _rolling_mean(close, period):
+    out = np.full(close.shape, np.nan)
+    if close.shape[0] >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(close, period, axis=0)
+        out[period - 1:] = windows.sum(axis=-1) / period
+    return out
+
+
+def _fsum_mean(column, i, period):
+    return math.fsum(column[i - period + 1:i + 1]) / period
+
+
+def crossover_signals(close, short_period, long_period):
+    """
+    (T, N) closes -> (cross_up, cross_down) boolean arrays.
+    Same comparisons as next(): sma_short[0] vs sma_long[0] and sma_short[-1] vs sma_long[-1].
+    Near-ties are recomputed with math.fsum so the sign matches backtrader's SMA exactly.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    short = _rolling_mean(close, short_period)
+    long = _rolling_mean(close, long_period)
+
+    with np.errstate(invalid='ignore'):
+        ties = np.abs(short - long) <= TIE_TOLERANCE * np.abs(long)
+    for i, n in zip(*np.nonzero(ties)):
+        short[i, n] = _fsum_mean(close[:, n], i, short_period)
+        long[i, n] = _fsum_mean(close[:, n], i, long_period)
+
+    prev_short = np.vstack([np.full((1, close.shape[1]), np.nan), short[:-1]])
+    prev_long = np.vstack([np.full((1, close.shape[1]), np.nan), long[:-1]])
+    with np.errstate(invalid='ignore'):
+        cross_up = (short > long) & (prev_short <= prev_long)
+        cross_down = (short < long) & (prev_short >= prev_long)
+    return cross_up, cross_down
+
+
+def round_prices(close):
+    """ Python round(price, 2) for a whole array: np.round, with near-half cases redone by round() """
+    rounded = np.round(close, 2)
+    scaled = close * 100
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for idx in zip(*np.nonzero(near_half)):
+        rounded[idx] = round(float(close[idx]), 2)
+    return rounded
+
+
+# === STATE === #
+def new_state(n_tickers, initial_cash):
+    """
+    Flat, empty book: arrays only so the kernel can mutate it in place and it can be snapshotted.
+    The q_* arrays hold the orders submitted on the last bar, at most one per ticker.
+    exit_* is the resting risk exit of each open position (bar index within the current run, -1 for none);
+    peak / held carry the highest high and bars held of open positions from one run to the next.
+    """
+    return {
+        'cash': np.array([float(initial_cash)]),
+        'pos_size': np.zeros(n_tickers, dtype=np.int64),
+        'pos_price': np.zeros(n_tickers),
+        'buy_price': np.zeros(n_tickers),
+        'buy_size': np.zeros(n_tickers, dtype=np.int64),
+        'buy_day': np.zeros(n_tickers, dtype=np.int64),
+        'q_ticker': np.zeros(n_tickers, dtype=np.int64),
+        'q_side': np.zeros(n_tickers, dtype=np.int64),
+        'q_size': np.zeros(n_tickers, dtype=np.int64),
+        'q_price': np.zeros(n_tickers),
+        'q_len': np.zeros(1, dtype=np.int64),
+        'exit_bar': np.full(n_tickers, -1, dtype=np.int64),
+        'exit_price': np.zeros(n_tickers),
+        'exit_reason': np.zeros(n_tickers, dtype=np.int64),
+        'peak': np.zeros(n_tickers),
+        'held': np.zeros(n_tickers, dtype=np.int64),
+    }
+
+
+def state_to_json(state):
+    return {key: state[key].tolist() for key in STATE_FIELDS}
+
+
+def state_from_json(data):
+    state = new_state(len(data['pos_size']), data['cash'][0])
+    for key in STATE_FIELDS:
+        if key in data:  # snapshots written before risk exits existed lack the exit_* / peak / held fields
+            state[key][:] = data[key]
+    return state
+
+
+# === KERNEL === #
+def simulate_bars(open_, close, close_r, cross_up, cross_down, days, first_bar, max_weight,
+                  x_bar, x_price, x_reason,
+                  cash, pos_size, pos_price, buy_price, buy_size, buy_day,
+                  q_ticker, q_side, q_size, q_price, q_len, exit_bar, exit_price, exit_reason,
+                  equity, f_bar, f_ticker, f_side, f_size, f_price, f_entry_price, f_entry_day, f_cash, f_reason):
+    """
+    Per-bar state machine for the default BackBroker (market orders, no commission) and the crossover strategy.
+    Each bar: accept/reject the orders submitted on the previous bar, fill resting risk exits and then the accepted
+    orders in submission order, mark the book to the close, then run the strategy from `first_bar` onwards.
+    x_bar / x_price / x_reason is the risk exit table from engine.risk_exits, looked up when a buy fills.
+    backtrader notifies Submitted/Accepted before next(), which resets self.orders[name] every bar, so that
+    guard never blocks and is not modelled. Long-only: sells never exceed the position.
+    Only scalars and preallocated arrays are used so numba can compile it unchanged (see get_kernel).
+    Returns the number of fills written.
+    """
+    n_bars, n_tickers = close.shape
+    pseudo_size = np.zeros(n_tickers, dtype=np.int64)
+    accepted = np.zeros(n_tickers, dtype=np.bool_)
+    n_fills = 0
+
+    for t in range(n_bars):
+        # --- broker: check orders submitted on the previous bar --- #
+        # pseudo-execution at the creation close; the running cash carries over even after a margin
+        pseudo_cash = cash[0]
+        for n in range(n_tickers):
+            pseudo_size[n] = pos_size[n]
+        for k in range(q_len[0]):
+            n = q_ticker[k]
+            size = q_size[k]
+            if q_side[k] == BUY:
+                pseudo_size[n] += size
+                pseudo_cash -= size * q_price[k]
+            else:
+                closed = min(size, pseudo_size[n]) if pseudo_size[n] > 0 else 0
+                pseudo_size[n] -= size
+                pseudo_cash += closed * q_price[k]
+            accepted[k] = pseudo_cash >= 0.0
+
+        # --- broker: risk exits rest since the entry fill, so they go before this bar's market orders --- #
+        first_fill = n_fills
+        for n in range(n_tickers):
+            if pos_size[n] > 0 and exit_bar[n] == t:
+                size = pos_size[n]
+                price = exit_price[n]
+                pnl = size * (price - pos_price[n]) * 1.0
+                cash[0] = cash[0] + (size * pos_price[n] + pnl)
+                pos_size[n] = 0
+                pos_price[n] = 0.0
+                exit_bar[n] = -1
+                f_entry_price[n_fills] = buy_price[n]
+                f_entry_day[n_fills] = buy_day[n]
+                f_bar[n_fills] = t
+                f_ticker[n_fills] = n
+                f_side[n_fills] = SELL
+                f_size[n_fills] = size
+                f_price[n_fills] = (size * price) / size
+                f_reason[n_fills] = exit_reason[n]
+                n_fills += 1
+
+        # --- broker: execute accepted market orders at the open --- #
+        # a buy the cash at the open can't cover is a margin; every order is done after this bar
+        for k in range(q_len[0]):
+            if not accepted[k]:
+                continue
+            n = q_ticker[k]
+            size = q_size[k]
+            price = open_[t, n]
+            if q_side[k] == BUY:
+                if cash[0] - size * price < 0.0:
+                    continue
+                cash[0] = cash[0] - size * price
+                if pos_size[n] == 0:
+                    pos_price[n] = price
+                else:
+                    pos_price[n] = (pos_price[n] * pos_size[n] + size * price) / (pos_size[n] + size)
+                pos_size[n] += size
+                # order.executed.price is the size-weighted average of its fills: (size * price) / size
+                buy_price[n] = (size * price) / size
+                buy_size[n] = size
+                buy_day[n] = days[t]
+                exit_bar[n] = x_bar[t, n]
+                exit_price[n] = x_price[t, n]
+                exit_reason[n] = x_reason[t, n]
+                f_entry_price[n_fills] = buy_price[n]
+                f_entry_day[n_fills] = days[t]
+            else:
+                size = min(size, pos_size[n])
+                if size <= 0:
+                    continue
+                pnl = size * (price - pos_price[n]) * 1.0
+                cash[0] = cash[0] + (size * pos_price[n] + pnl)
+                pos_size[n] -= size
+                if pos_size[n] == 0:
+                    pos_price[n] = 0.0
+                    exit_bar[n] = -1
+                f_entry_price[n_fills] = buy_price[n]
+                f_entry_day[n_fills] = buy_day[n]
+
+            f_bar[n_fills] = t
+            f_ticker[n_fills] = n
+            f_side[n_fills] = q_side[k]
+            f_size[n_fills] = size
+            f_price[n_fills] = (size * price) / size
+            f_reason[n_fills] = EXIT_SIGNAL
+            n_fills += 1
+        q_len[0] = 0
+
+        for j in range(first_fill, n_fills):
+            f_cash[j] = cash[0]
+
+        # --- broker: mark to market --- #
+        pos_value = 0.0
+        for n in range(n_tickers):
+            if pos_size[n] > 0:
+                dvalue = pos_size[n] * close[t, n]
+                dunrealized = pos_size[n] * (close[t, n] - pos_price[n]) * 1.0
+                pos_value += (dvalue - dunrealized) / 1.0
+                pos_value += dunrealized
+        value = cash[0] + pos_value
+
+        # --- strategy: next() --- #
+        if t < first_bar:
+            continue
+        equity[t] = value
+        for n in range(n_tickers):
+            if pos_size[n] == 0:
+                if cross_up[t, n]:
+                    size = int((cash[0] * max_weight) // close_r[t, n]) if close_r[t, n] != 0 else 0
+                    if size > 0:
+                        q_ticker[q_len[0]] = n
+                        q_side[q_len[0]] = BUY
+                        q_size[q_len[0]] = size
+                        q_price[q_len[0]] = close[t, n]
+                        q_len[0] += 1
+            elif cross_down[t, n] and buy_size[n] != 0:
+                q_ticker[q_len[0]] = n
+                q_side[q_len[0]] = SELL
+                q_size[q_len[0]] = abs(buy_size[n])
+                q_price[q_len[0]] = close[t, n]
+                q_len[0] += 1
+
+    return n_fills
+
+
+_compiled_kernel = None
+
+
+def get_kernel(jit=USE_JIT):
+    """
+    simulate_bars compiled with numba when it is installed, the plain Python function otherwise.
+    Compilation happens on first use and is cached on disk, so only the first run in a fresh checkout pays for it.
+    """
+    global _compiled_kernel
+    if not jit:
+        return simulate_bars
+    if _compiled_kernel is None:
+        try:
+            import numba
+        except ImportError:
+            _compiled_kernel = simulate_bars
+        else:
+            _compiled_kernel = numba.njit(cache=True, nogil=True)(simulate_bars)
+    return _compiled_kernel
+
+
+# === DRIVER === #
+def run_crossover(open_, close, days, short_period, long_period, initial_cash=100000,
+                  max_weight=MAX_POSITION_WEIGHT, state=None, history_close=None, jit=USE_JIT,
+                  high=None, low=None, risk=None, signals=None):
+    """
+    Simulate (T, N) aligned bars. Without `state` this is a full run from a flat book and next() starts once
+    the long SMA is defined. With `state` the bars continue a previous run and `history_close` must hold the
+    last `long_period` closes before them so the SMA windows line up.
+    `risk` adds stop_loss / take_profit / trailing_stop (fractions of the entry or peak price) and max_hold_bars
+    exits on top of the crossover sell; those need the `high` and `low` arrays for intrabar triggers.
+    `signals` takes precomputed (cross_up, cross_down) for a full run, so sweeps over exits reuse them.
+    Returns dict(equity, fills, state); equity is NaN on bars before the first next().
+    `jit=False` runs the Python kernel; both give identical results.
+    """
+    open_ = np.ascontiguousarray(open_, dtype=np.float64)
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    days = np.asarray(days, dtype=np.int64)
+    n_bars, n_tickers = close.shape
+    if risk_enabled(risk):
+        high = np.ascontiguousarray(high, dtype=np.float64)
+        low = np.ascontiguousarray(low, dtype=np.float64)
+
+    # buys fill at the open after the cross-up bar
+    entries = np.zeros((n_bars, n_tickers), dtype=np.bool_)
+    if state is None:
+        state = new_state(n_tickers, initial_cash)
+        cross_up, cross_down = signals if signals is not None else crossover_signals(close, short_period, long_period)
+        first_bar = long_period - 1
+        cross_down_live = cross_down.copy()
+        cross_down_live[:first_bar] = False
+        entries[first_bar + 1:] = cross_up[first_bar:-1]
+    else:
+        history_close = np.asarray(history_close, dtype=np.float64).reshape(-1, n_tickers)
+        cross_up, cross_down = crossover_signals(np.vstack([history_close, close]), short_period, long_period)
+        cross_up, cross_down = cross_up[len(history_close):], cross_down[len(history_close):]
+        first_bar = 0
+        cross_down_live = cross_down
+        entries[1:] = cross_up[:-1]
+        for k in range(state['q_len'][0]):
+            if state['q_side'][k] == BUY:
+                entries[0, state['q_ticker'][k]] = True
+        if risk_enabled(risk):
+            resume_exits(open_, high, low, cross_down, state, risk)
+    x_bar, x_price, x_reason = exit_table(open_, high, low, entries, cross_down_live, risk)
+
+    # every sell closes a position opened by a cross-up buy (or one carried in the state)
+    capacity = int(2 * cross_up.sum() + cross_down.sum()) + state['q_len'][0] + n_tickers
+    fills = {
+        'bar': np.zeros(capacity, dtype=np.int64),
+        'ticker': np.zeros(capacity, dtype=np.int64),
+        'side': np.zeros(capacity, dtype=np.int64),
+        'size': np.zeros(capacity, dtype=np.int64),
+        'price': np.zeros(capacity),
+        'entry_price': np.zeros(capacity),
+        'entry_day': np.zeros(capacity, dtype=np.int64),
+        'cash': np.zeros(capacity),
+        'reason': np.zeros(capacity, dtype=np.int64),
+    }
+    equity = np.full(n_bars, np.nan)
+
+    n_fills = get_kernel(jit)(
+        open_, close, round_prices(close), cross_up, cross_down, days, first_bar, max_weight,
+        x_bar, x_price, x_reason,
+        state['cash'], state['pos_size'], state['pos_price'], state['buy_price'], state['buy_size'], state['buy_day'],
+        state['q_ticker'], state['q_side'], state['q_size'], state['q_price'], state['q_len'],
+        state['exit_bar'], state['exit_price'], state['exit_reason'],
+        equity, fills['bar'], fills['ticker'], fills['side'], fills['size'], fills['price'],
+        fills['entry_price'], fills['entry_day'], fills['cash'], fills['reason'],
+    )
+    fills = {key: values[:n_fills] for key, values in fills.items()}
+    fills['day'] = days[fills['bar']]
+    if risk_enabled(risk):
+        track_open_positions(high, days, state)
+    return {'equity': equity, 'fills': fills, 'state': state}
+
+
+def closed_trades(fills, tickers):
+    """ Sell fills as the strategy's trade rows: pnl = round((sell - last buy price) * size, 2), plus the exit reason """
+    trades = []
+    for i in np.nonzero(fills['side'] == SELL)[0]:
+        buy_price = float(fills['entry_price'][i])
+        sell_price = float(fills['price'][i])
+        size = int(fills['size'][i])
+        trades.append({
+            'ticker': tickers[fills['ticker'][i]],
+            'buy_day': int(fills['entry_day'][i]),
+            'sell_day': int(fills['day'][i]),
+            'buy_price': buy_price,
+            'sell_price': sell_price,
+            'size': size,
+            'pnl': round((sell_price - buy_price) * size, 2),
+            'cash_after_trade': round(float(fills['cash'][i]), 2),
+            'exit_reason': EXIT_REASONS[fills['reason'][i]],
+        })
+    return trades
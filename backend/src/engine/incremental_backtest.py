@@ -0,0 +1,239 @@
+# Delta-based incremental backtest: resume each (strategy, params, tickers) book from its end-of-run snapshot
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics.run_analytics import make_trade_fact, record_run
+from engine.crossover_kernel import closed_trades, run_crossover, state_from_json, state_to_json
+from engine.risk_exits import RISK_KEYS
+from middleware.structured_logging import setup_logging
+from repository.database import DB_PATH, bulk_insert, connect
+from repository.data_panel import DataPanel
+from repository.price_store import history_fingerprint, refresh_prices
+
+# === CONFIGURATION === #
+INITIAL_CASH = 100000
+TICKERS = ['AAPL', 'MSFT', 'GOOGL']
+START_DATE = '2020-01-01'
+MAX_POSITION_WEIGHT = 0.5
+
+# === DATABASE === #
+TRADE_TABLE = "backtestv1"
+EQUITY_TABLE = "equity_curve"
+SNAPSHOT_TABLE = "backtest_snapshots"
+
+# === STRATEGY PARAMETERS === #
+STRATEGY_NAME = "ma_crossover_portfolio"
+STRATEGY_PARAMS = {
+    'short_period': 20,
+    'long_period': 50,
+    'stop_loss': None,       # fraction below the entry price, e.g. 0.05
+    'take_profit': None,     # fraction above the entry price
+    'trailing_stop': None,   # fraction below the highest high since entry
+    'max_hold_bars': None,   # exit at the open once held this many bars
+}
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {SNAPSHOT_TABLE} (
+        strategy TEXT NOT NULL,
+        params TEXT NOT NULL,
+        tickers TEXT NOT NULL,
+        last_day INTEGER NOT NULL,
+        window TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        state TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (strategy, params, tickers)
+    )
+"""
+
+
+def connect_db(db_path=DB_PATH):
+    conn = connect(db_path)
+    conn.execute(SCHEMA)
+    return conn
+
+
+# === DATA === #
+def load_panel(tickers, start=None, db_path=DB_PATH):
+    """ Aligned (dates, open, high, low, close) for the universe from the price store; dates every ticker has a bar for """
+    # not the shared cache: the window start moves every night, and a resumed run only needs its own bars
+    panel = DataPanel.from_store(tickers, start=start, db_path=db_path).common()
+    opens, highs, lows, closes = (np.array(panel.field(field)) for field in ('Open', 'High', 'Low', 'Close'))
+    return np.array(panel.days), opens, highs, lows, closes
+
+
+def window_digest(days, opens, closes):
+    digest = hashlib.sha1()
+    for array in (days, opens, closes):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def day_to_str(day):
+    return str(np.datetime64(int(day), 'D'))
+
+
+def day_to_datetime(day):
+    return datetime(1970, 1, 1) + timedelta(days=int(day))
+
+
+# === SNAPSHOTS === #
+def load_snapshot(key, db_path=DB_PATH):
+    conn = connect_db(db_path)
+    row = conn.execute(f"""
+        SELECT last_day, window, fingerprint, state FROM {SNAPSHOT_TABLE}
+        WHERE strategy = ? AND params = ? AND tickers = ?
+    """, key).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return {
+        'last_day': row[0],
+        'window': json.loads(row[1]),
+        'fingerprint': json.loads(row[2]),
+        'state': state_from_json(json.loads(row[3])),
+    }
+
+
+def save_snapshot(key, tickers, days, opens, closes, state, window_size, last_equity=None, db_path=DB_PATH):
+    """
+    Keep the state plus the last `window_size` bars (the SMA windows), the closing equity and a fingerprint of
+    all history
+    """
+    last_day = int(days[-1])
+    window = {
+        'days': days[-window_size:].tolist(),
+        'digest': window_digest(days[-window_size:], opens[-window_size:], closes[-window_size:]),
+        'closes': closes[-window_size:].tolist(),
+        'equity': last_equity,
+    }
+    fingerprint = [history_fingerprint(ticker, day_to_str(last_day), db_path) for ticker in tickers]
+    conn = connect_db(db_path)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO {SNAPSHOT_TABLE} (strategy, params, tickers, last_day, window, fingerprint, state, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, key + (last_day, json.dumps(window), json.dumps(fingerprint), json.dumps(state_to_json(state)), int(time.time())))
+    conn.commit()
+    conn.close()
+
+
+def snapshot_is_consistent(snapshot, tickers, days, opens, closes, db_path=DB_PATH):
+    """ Stored history up to the snapshot must be unchanged, otherwise its state no longer follows from the data """
+    window = snapshot['window']
+    size = len(window['days'])
+    if len(days) < size or days[:size].tolist() != window['days']:
+        return False
+    if window_digest(days[:size], opens[:size], closes[:size]) != window['digest']:
+        return False
+    last_date = day_to_str(snapshot['last_day'])
+    return [history_fingerprint(ticker, last_date, db_path) for ticker in tickers] == snapshot['fingerprint']
+
+
+# === PERSIST === #
+def persist_results(tickers, days, result, db_path=DB_PATH):
+    label = tickers[0] if len(tickers) == 1 else 'PORTFOLIO'
+    equity = result['equity']
+    equity_rows = [
+        (day_to_str(day), label, round(float(value), 2))
+        for day, value in zip(days, equity) if not np.isnan(value)
+    ]
+    trade_rows = [
+        (day_to_str(t['sell_day']), t['ticker'], t['buy_price'], t['sell_price'], t['size'], t['pnl'],
+         t['cash_after_trade'], str(timedelta(days=t['sell_day'] - t['buy_day'])))
+        for t in closed_trades(result['fills'], tickers)
+    ]
+
+    conn = connect(db_path)
+    try:
+        bulk_insert(EQUITY_TABLE, ('date', 'ticker', 'equity'), equity_rows, conn=conn)
+        bulk_insert(TRADE_TABLE, ('datetime', 'ticker', 'buy_price', 'sell_price', 'size', 'pnl', 'cash_after_trade',
+                                  'time_held'), trade_rows, conn=conn)
+    finally:
+        conn.close()
+    return len(equity_rows), len(trade_rows)
+
+
+def record_segment(key, tickers, days, result, mode, last_equity=None, db_path=DB_PATH):
+    """
+    Record the simulated bars as one run in the analytics tables. An incremental segment starts from the previous
+    run's closing equity, so its metrics cover the returns of the appended bars only; `mode` in the params tells
+    segments and full replays apart, and the leaderboards only rank full replays.
+    """
+    equity = result['equity']
+    live = ~np.isnan(equity)
+    dates = [day_to_str(day) for day in days[live]]
+    values = equity[live].tolist()
+    if last_equity is not None:
+        values = [last_equity] + values
+    trades = [
+        make_trade_fact(t['ticker'], day_to_datetime(t['buy_day']), day_to_datetime(t['sell_day']), t['buy_price'],
+                        t['sell_price'], t['size'], t['pnl'], t['cash_after_trade'])
+        for t in closed_trades(result['fills'], tickers)
+    ]
+    return record_run(key[0], {**json.loads(key[1]), 'mode': mode}, tickers, dates, values, trades, db_path)
+
+
+# === RUN === #
+def run_incremental(tickers, params=STRATEGY_PARAMS, initial_cash=INITIAL_CASH, start=START_DATE, db_path=DB_PATH):
+    """
+    Simulate only the bars that arrived since the last run of this (strategy, params, tickers) configuration.
+    Falls back to a full replay from `start` when there is no snapshot or stored history was revised.
+    """
+    tickers = list(tickers)
+    short_period, long_period = params['short_period'], params['long_period']
+    risk = {key: params.get(key) for key in RISK_KEYS}
+    key = (STRATEGY_NAME, json.dumps({**params, 'initial_cash': initial_cash, 'start': start}, sort_keys=True),
+           ','.join(tickers))
+
+    snapshot = load_snapshot(key, db_path)
+    mode = 'full'
+    if snapshot is not None:
+        days, opens, highs, lows, closes = load_panel(tickers, start=day_to_str(snapshot['window']['days'][0]),
+                                                      db_path=db_path)
+        if snapshot_is_consistent(snapshot, tickers, days, opens, closes, db_path):
+            mode = 'incremental'
+        else:
+            logging.warning(f"♻️ History revised for {','.join(tickers)}, replaying from {start}")
+
+    if mode == 'incremental':
+        new = days > snapshot['last_day']
+        if not new.any():
+            return {'mode': 'up_to_date', 'new_bars': 0, 'trades': 0}
+        history = np.asarray(snapshot['window']['closes'], dtype=float)
+        result = run_crossover(opens[new], closes[new], days[new], short_period, long_period,
+                               max_weight=MAX_POSITION_WEIGHT, state=snapshot['state'], history_close=history,
+                               high=highs[new], low=lows[new], risk=risk)
+        run_days = days[new]
+    else:
+        days, opens, highs, lows, closes = load_panel(tickers, start=start, db_path=db_path)
+        if len(days) < long_period:
+            return {'mode': 'insufficient_data', 'new_bars': len(days), 'trades': 0}
+        result = run_crossover(opens, closes, days, short_period, long_period, initial_cash, MAX_POSITION_WEIGHT,
+                               high=highs, low=lows, risk=risk)
+        run_days = days
+
+    _, n_trades = persist_results(tickers, run_days, result, db_path)
+    last_equity = snapshot['window'].get('equity') if mode == 'incremental' else None
+    run_id = record_segment(key, tickers, run_days, result, mode, last_equity, db_path)
+    save_snapshot(key, tickers, days, opens, closes, result['state'], long_period, float(result['equity'][-1]),
+                  db_path)
+    return {'mode': mode, 'new_bars': len(run_days), 'trades': n_trades, 'run_id': run_id,
+            'final_value': float(result['equity'][-1])}
+
+
+# === MAIN === #
+if __name__ == '__main__':
+    setup_logging()
+    for ticker in TICKERS:
+        start_time = time.time()
+        refresh_prices(ticker, START_DATE, db_path=DB_PATH)
+        summary = run_incremental([ticker])
+        logging.info(f"⏩ {ticker}: {summary} | Time: {time.time() - start_time:.2f}s")
@@ -0,0 +1,84 @@
+# Grid sweeps over MA periods and risk exits on the array kernel: signals are computed once per MA pair
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics.benchmark_analytics import BENCHMARK, load_benchmark, relative_metrics, simple_returns
+from analytics.run_analytics import compute_equity_metrics
+from engine.crossover_kernel import MAX_POSITION_WEIGHT, crossover_signals, run_crossover
+from engine.incremental_backtest import load_panel
+from engine.risk_exits import EXIT_REASONS
+from repository.database import DB_PATH
+
+# === CONFIGURATION === #
+TICKERS = ['AAPL', 'MSFT', 'GOOGL']
+START_DATE = '2020-01-01'
+INITIAL_CASH = 100000
+MA_GRID = [(10, 30), (20, 50), (50, 200)]
+RISK_GRID = {
+    'stop_loss': [None, 0.03, 0.05, 0.08],
+    'take_profit': [None, 0.1, 0.2],
+    'trailing_stop': [None, 0.05, 0.1],
+    'max_hold_bars': [None, 60],
+}
+
+
+def risk_grid(grid=RISK_GRID):
+    """ Every combination of the exit settings as risk dicts """
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def sweep(opens, highs, lows, closes, days, ma_grid=MA_GRID, risks=None, initial_cash=INITIAL_CASH,
+          max_weight=MAX_POSITION_WEIGHT, benchmark_prices=None):
+    """
+    One row per (short, long, risk) combination with the run's equity metrics and exit counts.
+    Only the exit table and the compiled kernel run per combination. With `benchmark_prices` aligned to `days`,
+    alpha / beta / information ratio are added for all runs at once from the stacked equity curves.
+    """
+    risks = risk_grid() if risks is None else risks
+    rows, curves = [], []
+    for short_period, long_period in ma_grid:
+        if len(days) < long_period:
+            continue
+        signals = crossover_signals(closes, short_period, long_period)
+        for risk in risks:
+            result = run_crossover(opens, closes, days, short_period, long_period, initial_cash, max_weight,
+                                   high=highs, low=lows, risk=risk, signals=signals)
+            equity = result['equity'][long_period - 1:]
+            curves.append(np.concatenate((np.full(long_period - 1, np.nan), equity)))
+            reasons = result['fills']['reason'][result['fills']['side'] < 0]
+            rows.append({
+                'short_period': short_period,
+                'long_period': long_period,
+                **risk,
+                **compute_equity_metrics(equity),
+                'trades': int(len(reasons)),
+                **{f"exits_{name}": int((reasons == code).sum()) for code, name in enumerate(EXIT_REASONS)},
+            })
+
+    if benchmark_prices is not None and rows:
+        relative = relative_metrics(simple_returns(np.column_stack(curves)), simple_returns(benchmark_prices))
+        for i, row in enumerate(rows):
+            row.update({key: float(values[i]) for key, values in relative.items() if key != 'observations'})
+    return rows
+
+
+# === MAIN === #
+if __name__ == '__main__':
+    start_time = time.time()
+    days, opens, highs, lows, closes = load_panel(TICKERS, start=START_DATE, db_path=DB_PATH)
+    benchmark = load_benchmark(days, db_path=DB_PATH)
+    rows = sweep(opens, highs, lows, closes, days,
+                 benchmark_prices=benchmark if np.isfinite(benchmark).sum() > 1 else None)
+    rows.sort(key=lambda row: row.get('sharpe', 0.0), reverse=True)
+    for row in rows[:10]:
+        print(f"📈 MA {row['short_period']}/{row['long_period']} | SL {row['stop_loss']} | TP {row['take_profit']} | "
+              f"Trail {row['trailing_stop']} | Hold {row['max_hold_bars']} | Sharpe {row.get('sharpe', 0.0):.2f} | "
+              f"Return {row.get('total_return', 0.0) * 100:.2f}% | "
+              f"Alpha vs {BENCHMARK} {row.get('alpha', float('nan')):.3f} | Trades {row['trades']}")
+    print(f"⏱️ {len(rows)} runs in {time.time() - start_time:.2f}s")
@@ -0,0 +1,634 @@
+# Golden regression harness: the backtrader strategy is the reference and every fast path must reproduce its trades
+# Run offline: python backend/src/engine/regression_harness.py [--update]   (--update re-records golden_results.json)
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'frontend'))
+import chart_data_service
+import main.run as reference
+from analytics import run_analytics
+from analytics.benchmark_analytics import ROLLING_WINDOW, drawdown_summary, load_equity_matrix, relative_metrics
+from analytics.benchmark_analytics import rolling_correlation, simple_returns
+from analytics.run_analytics import make_trade_fact, record_run, to_epoch_day
+from engine import incremental_backtest
+from engine.benchmark_kernel import same_result, synthetic_panel, timed_run
+from engine.crossover_kernel import closed_trades, crossover_signals, get_kernel, run_crossover, simulate_bars
+from engine.crossover_kernel import state_from_json, state_to_json
+from engine.risk_exits import EXIT_REASONS, RISK_KEYS
+from equity_curve.equity_buffer import feed_calendar
+from repository import data_panel
+from repository.data_panel import DataPanel
+from repository.price_store import store_prices
+
+# === CONFIGURATION === #
+SHORT_PERIOD = 20
+LONG_PERIOD = 50
+INITIAL_CASH = 100000
+PRICE_TOL = 1e-9  # fill prices are computed the same way on every path, only float noise is allowed
+MONEY_TOL = 0.01  # pnl, cash and equity are compared to the cent
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_results.json')
+# Real daily bars (Yahoo Finance, as shipped with the `backtesting` and `arch` packages' test data) of GOOG, the
+# S&P 500 and the Nasdaq Composite over 2008-01..2009-03: crash gaps and a ~1200x price spread across tickers
+RECORDED_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'recorded_prices.csv')
+
+# name -> (seeds, bars): one random-walk ticker per seed, all on the same business-day calendar
+FIXTURES = {
+    'single': ((0,), 800),
+    'trio': ((0, 1, 2), 800),
+    'pair': ((7, 8), 800),
+    'universe': (tuple(range(10, 22)), 1500),
+}
+GOLDEN_FIXTURES = (*FIXTURES, 'recorded')
+TIMING_FIXTURE = 'universe'
+JIT_TIMING_PANEL = (2000, 40)  # (bars, tickers) for the compiled kernel; large enough that dispatch costs vanish
+TIMING_REPEATS = 3  # best of, for the compiled kernel timing
+
+# extra run on the local price store, e.g. REGRESSION_TICKERS=AAPL,MSFT (skipped when nothing is stored)
+STORE_TICKERS = [t for t in os.getenv("REGRESSION_TICKERS", "").split(',') if t]
+STORE_DB_PATH = os.getenv("DB_PATH", "stock_datas.db")
+
+RISK_CASES = [
+    {'stop_loss': 0.05},
+    {'take_profit': 0.1},
+    {'trailing_stop': 0.07},
+    {'max_hold_bars': 15},
+    {'stop_loss': 0.04, 'take_profit': 0.08, 'trailing_stop': 0.06, 'max_hold_bars': 40},
+]
+SPLIT_BARS = (300, 611, 1100)
+
+# minimum speedups; kept well under the measured ratios so a loaded CI box doesn't flake
+MIN_SPEEDUP = {
+    'kernel_vs_backtrader': 5.0,
+    'jit_vs_python': 8.0,
+    'batched_analytics_vs_pandas': 3.0,
+}
+
+
+# === FIXTURES === #
+def synthetic_bars(seed, n_bars, start='2020-01-01'):
+    """ fetch_data()-style OHLCV frame of a seeded random walk with consistent intrabar highs and lows """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(start, periods=n_bars)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, n_bars)))
+    open_ = close * np.exp(rng.normal(0, 0.01, n_bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n_bars)))
+    volume = rng.integers(100_000, 1_000_000, n_bars).astype(float)
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Adj Close': close,
+                         'Volume': volume}, index=index)
+
+
+def fixture_frames(name):
+    seeds, n_bars = FIXTURES[name]
+    return [f"T{seed}" for seed in seeds], [synthetic_bars(seed, n_bars) for seed in seeds]
+
+
+def recorded_frames(path=RECORDED_FIXTURE):
+    """ fetch_data()-style frames of the recorded fixture (date, ticker, open, ..., volume), on the dates all traded """
+    df = pd.read_csv(path, parse_dates=['date'])
+    tickers = list(dict.fromkeys(df['ticker']))
+    bars = df.pivot(index='date', columns='ticker').dropna()
+    columns = {'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'adj_close': 'Adj Close',
+               'volume': 'Volume'}
+    frames = [pd.DataFrame({name: bars[(column, ticker)].astype(float) for column, name in columns.items()})
+              for ticker in tickers]
+    return tickers, [frame.rename_axis(None) for frame in frames]
+
+
+def store_frames(tickers, db_path=STORE_DB_PATH):
+    """ Stored bars of the tickers on the dates they all traded, read straight from the store (no download) """
+    if not tickers or not os.path.exists(db_path):
+        return [], []
+    panel = DataPanel.from_store(tickers, db_path=db_path).common()
+    if len(panel) < 2 * LONG_PERIOD:
+        return [], []
+    return panel.tickers, [panel.frame(ticker) for ticker in panel.tickers]
+
+
+def stack(frames, field):
+    return np.column_stack([df[field].to_numpy(dtype=float) for df in frames])
+
+
+def calendar(frames):
+    return frames[0].index.values.astype('datetime64[D]').astype(np.int64)
+
+
+# === PATHS === #
+class ReferenceStrategy(reference.MovingAverageCrossoverStrategy):
+    """ run.py's strategy, also keeping the (date, label, equity) rows it wrote before EquityBuffer """
+
+    def __init__(self):
+        super().__init__()
+        self.legacy_rows = []
+
+    def next(self):
+        super().next()
+        self.legacy_rows.append((self.datas[0].datetime.date(0).strftime('%Y-%m-%d'), 'PORTFOLIO',
+                                 round(self.broker.getvalue(), 2)))
+
+    def stop(self):
+        pass  # results are compared in memory, nothing is saved
+
+
+def run_backtrader(tickers, frames):
+    cerebro = bt.Cerebro()
+    cerebro.addstrategy(ReferenceStrategy, short_period=SHORT_PERIOD, long_period=LONG_PERIOD)
+    cerebro.broker.set_cash(INITIAL_CASH)
+    for ticker, df in zip(tickers, frames):
+        feed = reference.PandasYahooData(dataname=df)
+        feed._name = ticker
+        cerebro.adddata(feed)
+
+    start_time = time.perf_counter()
+    strategy = cerebro.run()[0]
+    seconds = time.perf_counter() - start_time
+
+    trades = [(t[0], t[1], t[2], t[4], t[5], t[6], t[7], t[9]) for t in strategy.closed_trades]
+    return {
+        'trades': trades,
+        'equity': np.array(strategy.equity_curve.values),
+        'rows': strategy.equity_curve.rows(feed_calendar(strategy.datas[0].datetime.array), 'PORTFOLIO'),
+        'legacy_rows': strategy.legacy_rows,
+        'seconds': seconds,
+    }
+
+
+def kernel_trades(fills, tickers):
+    return [(t['ticker'], t['buy_day'], t['sell_day'], t['buy_price'], t['sell_price'], t['size'], t['pnl'],
+             t['cash_after_trade']) for t in closed_trades(fills, tickers)]
+
+
+def run_kernel(tickers, frames, jit, **kwargs):
+    start_time = time.perf_counter()
+    result = run_crossover(stack(frames, 'Open'), stack(frames, 'Close'), calendar(frames), SHORT_PERIOD,
+                           LONG_PERIOD, INITIAL_CASH, jit=jit, **kwargs)
+    seconds = time.perf_counter() - start_time
+    return {
+        'trades': kernel_trades(result['fills'], tickers),
+        'equity': np.round(result['equity'][LONG_PERIOD - 1:], 2),
+        'result': result,
+        'seconds': seconds,
+    }
+
+
+# === COMPARISONS === #
+def compare_trades(expected, actual, label):
+    """ Same trades in the same order: tickers, dates and sizes exactly, prices and money within tolerance """
+    assert len(expected) == len(actual), f"{label}: {len(expected)} trades expected, got {len(actual)}"
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        same = (a[0] == b[0] and a[1] == b[1] and a[2] == b[2] and a[5] == b[5]
+                and abs(a[3] - b[3]) <= PRICE_TOL and abs(a[4] - b[4]) <= PRICE_TOL
+                and abs(a[6] - b[6]) <= MONEY_TOL and abs(a[7] - b[7]) <= MONEY_TOL)
+        assert same, f"{label}: trade {i} differs\n  expected {a}\n  actual   {b}"
+
+
+def compare_equity(expected, actual, label):
+    expected, actual = np.asarray(expected, dtype=float), np.asarray(actual, dtype=float)
+    assert expected.shape == actual.shape, f"{label}: {expected.shape} equity bars expected, got {actual.shape}"
+    diff = np.abs(expected - actual)
+    if len(diff) and np.nanmax(diff) > MONEY_TOL:
+        bar = int(np.nanargmax(diff))
+        raise AssertionError(f"{label}: equity differs at bar {bar}: {expected[bar]} vs {actual[bar]}")
+
+
+def golden_record(run):
+    return {'trades': [list(trade) for trade in run['trades']], 'final_equity': float(run['equity'][-1]),
+            'equity_sum': round(float(run['equity'].sum()), 2)}
+
+
+def save_golden(records, path=GOLDEN_FILE):
+    """ One trade per line, so a drift shows up as a readable diff """
+    blocks = []
+    for name, record in records.items():
+        trades = ',\n'.join(f"      {json.dumps(trade)}" for trade in record['trades'])
+        blocks.append(f'  "{name}": {{\n    "final_equity": {json.dumps(record["final_equity"])},\n'
+                      f'    "equity_sum": {json.dumps(record["equity_sum"])},\n    "trades": [\n{trades}\n    ]\n  }}')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n' + ',\n'.join(blocks) + '\n}\n')
+
+
+# === CHECKS === #
+def check_backtrader_parity(name, tickers, frames, golden, timings):
+    """ Kernel (Python and compiled) vs backtrader: trades, equity curve, EquityBuffer rows, golden results """
+    expected = run_backtrader(tickers, frames)
+    assert expected['rows'] == expected['legacy_rows'], f"{name}: EquityBuffer rows differ from per-bar tuples"
+
+    for jit in (False, True):
+        actual = run_kernel(tickers, frames, jit)
+        label = f"{name} kernel({'jit' if jit else 'python'})"
+        compare_trades(expected['trades'], actual['trades'], label)
+        compare_equity(expected['equity'], actual['equity'], label)
+        timings[(name, 'jit' if jit else 'python')] = actual['seconds']
+    timings[(name, 'backtrader')] = expected['seconds']
+
+    if golden is None:
+        return golden_record(expected)
+    if name not in golden:
+        raise AssertionError(f"{name}: no golden record, run with --update")
+    record = golden[name]
+    compare_trades([tuple(trade) for trade in record['trades']], expected['trades'], f"{name} golden")
+    assert abs(record['final_equity'] - expected['equity'][-1]) <= MONEY_TOL, f"{name}: final equity drifted"
+    assert abs(record['equity_sum'] - expected['equity'].sum()) <= MONEY_TOL * len(expected['equity']), \
+        f"{name}: equity curve drifted from the golden record"
+    return record
+
+
+def naive_risk_exits(open_, high, low, close, risk):
+    """ One ticker, bar by bar: (bar, price, reason) of every sell, written independently of exit_table() """
+    cross_up, cross_down = (signal[:, 0] for signal in crossover_signals(close[:, None], SHORT_PERIOD, LONG_PERIOD))
+    stop_loss, take_profit, trailing_stop, max_hold = (risk.get(key) for key in RISK_KEYS)
+    holding, entry, peak, held, queued, exits = False, None, None, 0, None, []
+    for t in range(len(close)):
+        if holding and queued is None:
+            held += 1
+            level = entry * (1 - stop_loss) if stop_loss else -np.inf
+            trail_level = peak * (1 - trailing_stop) if trailing_stop else -np.inf
+            exit_ = None
+            if max_hold and held == max_hold:
+                exit_ = (open_[t], 'time')
+            elif low[t] <= max(level, trail_level):
+                reason = 'trailing_stop' if trail_level > level else 'stop_loss'
+                exit_ = (min(open_[t], max(level, trail_level)), reason)
+            elif take_profit and high[t] >= entry * (1 + take_profit):
+                exit_ = (max(open_[t], entry * (1 + take_profit)), 'take_profit')
+            if exit_:
+                exits.append((t, exit_[0], exit_[1]))
+                holding = False
+            else:
+                peak = max(peak, high[t])
+        if queued == 'buy':
+            holding, entry, peak, held = True, open_[t], high[t], 0
+        elif queued == 'sell' and holding:
+            exits.append((t, open_[t], 'signal'))
+            holding = False
+        queued = None
+        if t >= LONG_PERIOD - 1:
+            if not holding and cross_up[t]:
+                queued = 'buy'
+            elif holding and cross_down[t]:
+                queued = 'sell'
+    return exits
+
+
+def check_risk_exits(frames):
+    """ Kernel exits (Python and compiled) vs the naive bar-by-bar loop, one ticker at a time """
+    for risk in RISK_CASES:
+        for df in frames:
+            open_, high, low, close = (stack([df], field) for field in ('Open', 'High', 'Low', 'Close'))
+            expected = naive_risk_exits(open_[:, 0], high[:, 0], low[:, 0], close[:, 0], risk)
+            for jit in (False, True):
+                result = run_crossover(open_, close, calendar([df]), SHORT_PERIOD, LONG_PERIOD, INITIAL_CASH,
+                                       jit=jit, high=high, low=low, risk=risk)
+                fills = result['fills']
+                sells = fills['side'] < 0
+                actual = list(zip(fills['bar'][sells], fills['price'][sells], fills['reason'][sells]))
+                assert len(actual) == len(expected), f"{risk}: {len(expected)} exits expected, got {len(actual)}"
+                for (bar, price, reason), (ref_bar, ref_price, ref_reason) in zip(actual, expected):
+                    assert bar == ref_bar and EXIT_REASONS[reason] == ref_reason \
+                        and abs(price - ref_price) <= PRICE_TOL, \
+                        f"{risk} jit={jit}: exit ({bar}, {price}, {EXIT_REASONS[reason]}) vs reference " \
+                        f"({ref_bar}, {ref_price}, {ref_reason})"
+
+
+def check_split_resume(tickers, frames):
+    """ A run resumed from a JSON snapshot at any bar equals the uninterrupted run, with and without exits """
+    open_, high, low, close = (stack(frames, field) for field in ('Open', 'High', 'Low', 'Close'))
+    days = calendar(frames)
+    for risk in [None] + RISK_CASES:
+        full = run_crossover(open_, close, days, SHORT_PERIOD, LONG_PERIOD, INITIAL_CASH, high=high, low=low,
+                             risk=risk)
+        for cut in SPLIT_BARS:
+            head = run_crossover(open_[:cut], close[:cut], days[:cut], SHORT_PERIOD, LONG_PERIOD, INITIAL_CASH,
+                                 high=high[:cut], low=low[:cut], risk=risk)
+            state = state_from_json(json.loads(json.dumps(state_to_json(head['state']))))
+            tail = run_crossover(open_[cut:], close[cut:], days[cut:], SHORT_PERIOD, LONG_PERIOD, state=state,
+                                 history_close=close[cut - LONG_PERIOD:cut], high=high[cut:], low=low[cut:],
+                                 risk=risk)
+            label = f"split at {cut} risk={risk}"
+            assert np.array_equal(np.concatenate([head['equity'], tail['equity']]), full['equity'],
+                                  equal_nan=True), f"{label}: equity differs"
+            compare_trades(kernel_trades(full['fills'], tickers),
+                           kernel_trades(head['fills'], tickers) + kernel_trades(tail['fills'], tickers), label)
+
+
+def check_incremental_store(tickers, frames, workdir):
+    """
+    Nightly path end to end: bars stored in two batches, run_incremental() after each, trades read back from the
+    database must equal backtrader's full run.
+    """
+    db_path = os.path.join(workdir, 'incremental.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE backtestv1 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, datetime TEXT, ticker TEXT, buy_price REAL, sell_price REAL,
+            size INTEGER, pnl REAL, cash_after_trade REAL, time_held TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE equity_curve (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, ticker TEXT, equity REAL)
+    """)
+    conn.commit()
+    conn.close()
+
+    cut = len(frames[0]) * 2 // 3
+    params = {'short_period': SHORT_PERIOD, 'long_period': LONG_PERIOD}
+    start = str(frames[0].index[0].date())
+    modes = []
+    for batch in (slice(0, cut), slice(cut, None)):
+        for ticker, df in zip(tickers, frames):
+            store_prices(ticker, df.iloc[batch], db_path)
+        modes.append(incremental_backtest.run_incremental(tickers, params, INITIAL_CASH, start, db_path)['mode'])
+    assert modes == ['full', 'incremental'], f"incremental runs went {modes}"
+
+    conn = sqlite3.connect(db_path)
+    stored = conn.execute("""
+        SELECT ticker, datetime, buy_price, sell_price, size, pnl, cash_after_trade FROM backtestv1 ORDER BY id
+    """).fetchall()
+    equity = [row[0] for row in conn.execute("SELECT equity FROM equity_curve ORDER BY id")]
+    runs = conn.execute("SELECT params, n_trades, final_value FROM run_summary ORDER BY run_id").fetchall()
+    conn.close()
+    assert [json.loads(row[0])['mode'] for row in runs] == modes, "run_summary does not hold one run per segment"
+    assert sum(row[1] for row in runs) == len(stored), "run_summary trade counts differ from the stored trades"
+    assert abs(runs[-1][2] - equity[-1]) < 0.01, "last segment's final value differs from the equity curve"
+
+    expected = run_backtrader(tickers, frames)
+    actual = [(ticker, None, to_epoch_day(day), buy, sell, size, pnl, cash)
+              for ticker, day, buy, sell, size, pnl, cash in stored]
+    compare_trades([(t[0], None) + t[2:] for t in expected['trades']], actual, "incremental store")
+    compare_equity(expected['equity'], equity, "incremental store")
+
+
+def check_data_panel(tickers, frames, workdir):
+    """ Panel saved and memory-mapped back gives the source frames, and its slices share one buffer """
+    days = calendar(frames)
+    values = np.stack([stack(frames, field) for field in data_panel.FIELDS])
+    mask = np.isfinite(values[0])
+    mask[::97, -1] = False  # a few missing bars
+    values[:, ~mask] = np.nan
+    DataPanel(values, mask, days, tickers).save(os.path.join(workdir, 'panel'))
+    panel = DataPanel.open(os.path.join(workdir, 'panel'))
+
+    assert isinstance(panel.values, np.memmap), "saved panel was not memory-mapped"
+    for col, (ticker, df) in enumerate(zip(tickers, frames)):
+        expected = df[list(data_panel.FIELDS)][mask[:, col]]
+        frame = panel.frame(ticker)
+        assert frame.index.equals(expected.index) and np.array_equal(frame.values, expected.values), \
+            f"panel frame of {ticker} differs"
+    assert len(panel.common()) == int(mask.all(axis=1).sum()), "common() kept dates with missing bars"
+    window = panel.between(frames[0].index[100], frames[0].index[199])
+    assert len(window) == 100 and np.shares_memory(window.values, panel.values), "date slice copied the panel"
+    assert np.shares_memory(panel.select(tickers[1:3]).values, panel.values), "ticker slice copied the panel"
+
+    # shared cache: a saved panel is reused until store_prices() revises a bar of the universe
+    db_path = os.path.join(workdir, 'panel_store.db')
+    for ticker, df in zip(tickers, frames):
+        store_prices(ticker, df, db_path)
+    cached = data_panel.get_panel(tickers, db_path=db_path)
+    saved = os.path.join(data_panel.panel_path(tickers, db_path), 'values.npy')
+    written = os.stat(saved).st_mtime_ns
+    data_panel._session.clear()
+    reopened = data_panel.get_panel(tickers, db_path=db_path)
+    assert os.stat(saved).st_mtime_ns == written, "saved panel was rebuilt although the store is unchanged"
+    assert np.array_equal(cached.values, reopened.values, equal_nan=True), "reopened panel differs"
+    store_prices(tickers[1], frames[1].iloc[:1] * 1.5, db_path)
+    revised = data_panel.get_panel(tickers, db_path=db_path)
+    assert revised.field('Close')[0, 1] == frames[1]['Close'].iloc[0] * 1.5, "revised bar not seen by the panel"
+
+
+def check_benchmark_analytics(frames, timings, n_runs=400):
+    """ Batched alpha / beta / IR / max drawdown vs one pandas pass per run """
+    rng = np.random.default_rng(3)
+    bench = frames[0]['Close'].to_numpy()
+    bench_returns = pd.Series(bench).pct_change()
+    returns = bench_returns.to_numpy()[:, None] * rng.uniform(0.2, 1.5, n_runs) \
+        + rng.normal(0.0001, 0.01, (len(bench), n_runs))
+    returns[0] = 0.0
+    equity = INITIAL_CASH * np.cumprod(1 + returns, axis=0)
+
+    start_time = time.perf_counter()
+    relative = relative_metrics(simple_returns(equity), simple_returns(bench))
+    drawdowns = drawdown_summary(equity)
+    timings[('analytics', 'batched')] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for j in range(n_runs):
+        series = pd.Series(equity[:, j])
+        run_returns = series.pct_change()
+        valid = run_returns.notna() & bench_returns.notna()
+        x, y = run_returns[valid], bench_returns[valid]
+        beta = x.cov(y, ddof=0) / y.var(ddof=0)
+        alpha = (x.mean() - beta * y.mean()) * 252
+        active = x - y
+        information_ratio = active.mean() / active.std(ddof=0) * np.sqrt(252)
+        max_drawdown = (1 - series / series.cummax()).max()
+        expected = (beta, alpha, information_ratio, max_drawdown)
+        actual = (relative['beta'][j], relative['alpha'][j], relative['information_ratio'][j],
+                  drawdowns['max_drawdown'][j])
+        assert np.allclose(expected, actual, rtol=1e-9, atol=1e-12), f"run {j}: {actual} vs pandas {expected}"
+    timings[('analytics', 'pandas')] = time.perf_counter() - start_time
+
+    # rolling correlation with runs starting late and gaps shorter and longer than the window
+    equity[rng.integers(0, 400, n_runs)[None, :] > np.arange(len(bench))[:, None]] = np.nan
+    equity[700:710, ::3] = np.nan
+    equity[900:1000, ::5] = np.nan
+    rolling = rolling_correlation(simple_returns(equity), simple_returns(bench), ROLLING_WINDOW)
+    for j in range(n_runs):
+        run_returns = pd.Series(equity[:, j]).pct_change(fill_method=None)
+        expected = run_returns.rolling(ROLLING_WINDOW).corr(bench_returns).to_numpy()
+        assert np.allclose(expected, rolling[:, j], rtol=0, atol=1e-9, equal_nan=True), \
+            f"run {j}: rolling correlation differs from pandas at bar " \
+            f"{int(np.flatnonzero(~np.isclose(expected, rolling[:, j], atol=1e-9, equal_nan=True))[0])}"
+
+
+def check_chart_tiles(frames, workdir):
+    """
+    Equity tiles vs the raw curve: only the latest run of a label is served, every bucket's first / min / max / last
+    match the raw values at its dates, the pyramid is reused until new rows arrive, and an appended segment extends it
+    """
+    db_path = os.path.join(workdir, 'charts.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE equity_curve (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, ticker TEXT, equity REAL)
+    """)
+    index = frames[0].index
+    dates = index.strftime('%Y-%m-%d')
+    older, latest = (np.round(INITIAL_CASH * df['Close'].to_numpy() / df['Close'].iloc[0], 2) for df in frames[:2])
+    cut = 1000
+    insert = "INSERT INTO equity_curve (date, ticker, equity) VALUES (?, 'PORTFOLIO', ?)"
+    conn.executemany(insert, zip(dates, older.tolist()))
+    conn.executemany(insert, zip(dates[:cut], latest[:cut].tolist()))
+    conn.commit()
+
+    points = chart_data_service.load_equity_points('PORTFOLIO', db_path=db_path)
+    assert len(points) == cut and np.array_equal(points['equity'].to_numpy(), latest[:cut]), \
+        "equity points spliced an earlier run into the latest one"
+    _, matrix, _ = load_equity_matrix(['PORTFOLIO'], db_path=db_path)
+    assert np.array_equal(matrix[:, 0], latest[:cut]), "equity matrix spliced an earlier run into the latest one"
+
+    assert chart_data_service.build_tiles('PORTFOLIO', db_path), "tiles were not built"
+    assert not chart_data_service.build_tiles('PORTFOLIO', db_path), "unchanged tiles were rebuilt"
+
+    def check_buckets(n_points, max_points, **viewport):
+        raw = pd.Series(latest[:n_points], index=index[:n_points])
+        tiles = chart_data_service.get_equity_series('PORTFOLIO', max_points=max_points, db_path=db_path, **viewport)
+        for row in tiles.itertuples():
+            bucket = raw[row.start_date:row.date]
+            assert (row.first, row.min, row.max, row.last) == \
+                (bucket.iloc[0], bucket.min(), bucket.max(), bucket.iloc[-1]), \
+                f"tile {row.start_date.date()}..{row.date.date()} differs from the raw curve"
+        return tiles
+
+    tiles = check_buckets(cut, 100)
+    assert len(tiles) < cut // 2, f"{len(tiles)} points served for a 100-point viewport"
+    viewport = check_buckets(cut, 2000, start=index[200], end=index[300])
+    assert len(viewport) == 101 and viewport['date'].iloc[0] == index[200], "viewport is not at full resolution"
+
+    conn.executemany(insert, zip(dates[cut:cut + 100], latest[cut:cut + 100].tolist()))  # incremental segment
+    conn.commit()
+    conn.close()
+    tiles = check_buckets(cut + 100, 100)
+    assert tiles['date'].iloc[-1] == index[cut + 99], "appended segment is missing from the rebuilt tiles"
+
+
+def check_query_cache(workdir):
+    """ Cached analytics queries are served again until a run is recorded, then recomputed """
+    db_path = os.path.join(workdir, 'analytics.db')
+    rng = np.random.default_rng(5)
+    dates = pd.bdate_range('2021-01-01', periods=300)
+    noise = rng.normal(0, 1, len(dates))
+
+    def record(tickers, drift, volatility, mode='full', bars=len(dates)):
+        equity = INITIAL_CASH * np.cumprod(1 + drift + volatility * noise[:bars])
+        trade = make_trade_fact(tickers[0], dates[10], dates[60], 100.0, 110.0, 10, 100.0, INITIAL_CASH)
+        return record_run('harness', {'drift': drift, 'mode': mode}, tickers, dates[:bars], equity, [trade], db_path)
+
+    first = record(['T0'], 0.001, 0.01)
+    portfolio = record(['T0', 'T1'], 0.002, 0.01)
+    run_analytics._cached_query.cache_clear()
+
+    board = run_analytics.leaderboard(db_path=db_path)
+    again = run_analytics.leaderboard(db_path=db_path)
+    info = run_analytics._cached_query.cache_info()
+    assert (info.hits, info.misses) == (1, 1) and board.equals(again), f"leaderboard not served from cache: {info}"
+    assert board['run_id'].tolist() == [portfolio, first], "leaderboard is not ordered by Sharpe"
+    best = run_analytics.best_sharpe_per_ticker(db_path=db_path)
+    assert best[['ticker', 'run_id']].values.tolist() == [['T0', first]], \
+        "per-ticker Sharpe credited a ticker with a portfolio run"
+
+    record(['T0'], 0.01, 0.001, mode='incremental', bars=3)  # a nightly segment: a few bars, a huge Sharpe
+    latest = record(['T0'], 0.003, 0.005)
+    board = run_analytics.leaderboard(db_path=db_path)
+    assert board['run_id'].tolist() == [latest, portfolio, first], "stale leaderboard served after a new run"
+    assert run_analytics.best_sharpe_per_ticker(db_path=db_path)['run_id'].tolist() == [latest], \
+        "stale per-ticker Sharpe served after a new run"
+
+
+def check_speedups(timings):
+    """ Minimum speedup ratios of the fast paths, measured on the timing fixture """
+    jit_available = get_kernel(True) is not simulate_bars
+    ratios = {
+        'kernel_vs_backtrader': timings[(TIMING_FIXTURE, 'backtrader')] / timings[(TIMING_FIXTURE, 'python')],
+        'batched_analytics_vs_pandas': timings[('analytics', 'pandas')] / timings[('analytics', 'batched')],
+    }
+    if jit_available:
+        days, opens, closes = synthetic_panel(*JIT_TIMING_PANEL)
+        python_runs = [timed_run(opens, closes, days, jit=False) for _ in range(TIMING_REPEATS)]
+        jit_runs = [timed_run(opens, closes, days, jit=True) for _ in range(TIMING_REPEATS)]
+        assert same_result(python_runs[0][0], jit_runs[0][0]), "compiled kernel diverged from the Python kernel"
+        ratios['jit_vs_python'] = min(run[1] for run in python_runs) / min(run[1] for run in jit_runs)
+    else:
+        print("   numba not installed, compiled kernel speedup not checked")
+    for key, ratio in ratios.items():
+        print(f"   {key}: x{ratio:.1f} (min x{MIN_SPEEDUP[key]:.0f})")
+    slow = {key: round(ratio, 1) for key, ratio in ratios.items() if ratio < MIN_SPEEDUP[key]}
+    assert not slow, f"below minimum speedup: {slow}"
+
+
+# === MAIN === #
+def run_checks(update=False):
+    golden = None
+    if not update:
+        if os.path.exists(GOLDEN_FILE):
+            with open(GOLDEN_FILE, encoding='utf-8') as f:
+                golden = json.load(f)
+        else:
+            print(f"⚠️ {GOLDEN_FILE} missing, recording it from this run")
+            update = True
+
+    # compile (or load the cached kernel) up front so it isn't part of the timings
+    tickers, frames = fixture_frames('single')
+    run_kernel(tickers, frames[:1], jit=True)
+
+    timings, records, failures = {}, {}, []
+    workdir = tempfile.mkdtemp(prefix='regression_')
+    reference.DB_PATH = os.path.join(workdir, 'reference.db')  # anything the reference writes stays in the workdir
+    data_panel.PANEL_DIR = os.path.join(workdir, 'panels')
+
+    checks = []
+    for name in FIXTURES:
+        tickers, frames = fixture_frames(name)
+        checks.append((f"backtrader parity [{name}]",
+                       lambda name=name, tickers=tickers, frames=frames:
+                       records.update({name: check_backtrader_parity(name, tickers, frames, golden, timings)})))
+    recorded_tickers, recorded = recorded_frames()
+    checks.append((f"backtrader parity [recorded {','.join(recorded_tickers)}]",
+                   lambda: records.update({'recorded': check_backtrader_parity('recorded', recorded_tickers, recorded,
+                                                                               golden, timings)})))
+    store_tickers, stored = store_frames(STORE_TICKERS)
+    if stored:
+        checks.append((f"backtrader parity [price store {','.join(store_tickers)}]",
+                       lambda: check_backtrader_parity('price store', store_tickers, stored, None, timings)))
+    elif STORE_TICKERS:
+        print(f"⚠️ No stored bars for {','.join(STORE_TICKERS)} in {STORE_DB_PATH}, price store run skipped")
+
+    trio_tickers, trio = fixture_frames('trio')
+    universe_tickers, universe = fixture_frames('universe')
+    checks += [
+        ("risk exits vs bar-by-bar reference", lambda: check_risk_exits(universe[:4] + recorded)),
+        ("split / resume from snapshot", lambda: check_split_resume(universe_tickers[:6], universe[:6])),
+        ("incremental run through the price store", lambda: check_incremental_store(trio_tickers, trio, workdir)),
+        ("data panel round trip", lambda: check_data_panel(trio_tickers, trio, workdir)),
+        ("batched benchmark analytics", lambda: check_benchmark_analytics(universe, timings)),
+        ("equity tiles vs the raw curve", lambda: check_chart_tiles(universe, workdir)),
+        ("analytics query cache", lambda: check_query_cache(workdir)),
+        ("speedups", lambda: check_speedups(timings)),
+    ]
+
+    logging.disable(logging.CRITICAL)  # the reference strategy logs every trade
+    start_time = time.time()
+    try:
+        for label, check in checks:
+            check_start = time.time()
+            try:
+                check()
+                print(f"✅ {label} ({time.time() - check_start:.2f}s)")
+            except AssertionError as e:
+                failures.append(label)
+                print(f"❌ {label}: {e}")
+            except Exception as e:  # a crash in a fast path fails its check, the others still run
+                failures.append(label)
+                print(f"❌ {label}: {type(e).__name__}: {e}")
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if update and not failures:
+        save_golden({name: records[name] for name in GOLDEN_FIXTURES})
+        print(f"💾 Golden results recorded in {GOLDEN_FILE}")
+    print(f"⏱️ {len(checks) - len(failures)}/{len(checks)} checks passed in {time.time() - start_time:.2f}s")
+    return not failures
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run_checks(update='--update' in sys.argv) else 1)
@@ -0,0 +1,118 @@
+# Risk-managed exits (stop-loss, take-profit, trailing stop, time limit) found with array scans over holding periods
+import numpy as np
+
+# === CONFIGURATION === #
+RISK_KEYS = ('stop_loss', 'take_profit', 'trailing_stop', 'max_hold_bars')
+EXIT_SIGNAL = 0
+EXIT_STOP_LOSS = 1
+EXIT_TAKE_PROFIT = 2
+EXIT_TRAILING_STOP = 3
+EXIT_TIME = 4
+EXIT_REASONS = ('signal', 'stop_loss', 'take_profit', 'trailing_stop', 'time')
+
+
+def risk_enabled(risk):
+    return risk is not None and any(risk.get(key) for key in RISK_KEYS)
+
+
+# === SCANS === #
+def scan_exit(open_, high, low, start, end, entry_price, peak, held, risk):
+    """
+    First risk exit of one open position among bars [start, end] of a single ticker's columns.
+    `peak` is the highest high since the entry bar (inclusive) up to bar start - 1 and `held` the bars held at
+    start - 1. Exits behave like resting broker orders placed at the entry fill:
+      stop-loss / trailing stop fill at the level, or at the open when the bar gaps through it;
+      take-profit fills at the level, or at the open when the bar gaps above it;
+      the time exit fills at the open once the position has been held `max_hold_bars` bars.
+    When a stop and the take-profit are both touched inside one bar the stop is assumed to come first.
+    Returns (bar, price, reason), bar = -1 when nothing triggers.
+    """
+    stop_loss, take_profit = risk.get('stop_loss'), risk.get('take_profit')
+    trailing_stop, max_hold = risk.get('trailing_stop'), risk.get('max_hold_bars')
+
+    time_bar = -1
+    if max_hold:
+        time_bar = max(start + int(max_hold) - held - 1, start)
+        if time_bar <= end:
+            end = time_bar - 1
+        else:
+            time_bar = -1
+
+    if end >= start:
+        o, h, l = open_[start:end + 1], high[start:end + 1], low[start:end + 1]
+        fixed = entry_price * (1 - stop_loss) if stop_loss else -np.inf
+        level = np.full(len(o), fixed)
+        if trailing_stop:
+            prior_peak = np.maximum.accumulate(np.concatenate(([peak], h[:-1])))
+            trail = prior_peak * (1 - trailing_stop)
+            level = np.maximum(level, trail)
+        stop_hit = l <= level
+        hit = stop_hit
+        if take_profit:
+            target = entry_price * (1 + take_profit)
+            hit = stop_hit | (h >= target)
+        if hit.any():
+            i = int(np.argmax(hit))
+            if stop_hit[i]:
+                reason = EXIT_TRAILING_STOP if trailing_stop and level[i] > fixed else EXIT_STOP_LOSS
+                return start + i, float(min(o[i], level[i])), reason
+            return start + i, float(max(o[i], target)), EXIT_TAKE_PROFIT
+
+    if time_bar >= 0:
+        return time_bar, float(open_[time_bar]), EXIT_TIME
+    return -1, np.nan, EXIT_SIGNAL
+
+
+def exit_table(open_, high, low, entries, cross_down, risk):
+    """
+    Risk exit for every bar a position could be opened on, as (T, N) arrays indexed by the entry bar.
+    `entries` marks the bars a buy can fill on (the open after a cross-up) and `cross_down` the bars next() sells on.
+    Exit levels depend only on the entry open, not on the size, so the table is independent of the cash path and
+    the kernel just looks it up when a buy fills. Each scan stops at the next cross-down bar: from there the
+    crossover sell cancels the resting exits and closes the position at the following open.
+    """
+    n_bars, n_tickers = open_.shape
+    x_bar = np.full((n_bars, n_tickers), -1, dtype=np.int64)
+    x_price = np.full((n_bars, n_tickers), np.nan)
+    x_reason = np.zeros((n_bars, n_tickers), dtype=np.int64)
+    if not risk_enabled(risk):
+        return x_bar, x_price, x_reason
+
+    for n in range(n_tickers):
+        downs = np.flatnonzero(cross_down[:, n])
+        for entry in np.flatnonzero(entries[:, n]):
+            k = np.searchsorted(downs, entry)
+            end = downs[k] if k < len(downs) else n_bars - 1
+            x_bar[entry, n], x_price[entry, n], x_reason[entry, n] = scan_exit(
+                open_[:, n], high[:, n], low[:, n], entry + 1, end, open_[entry, n], high[entry, n], 0, risk)
+    return x_bar, x_price, x_reason
+
+
+def resume_exits(open_, high, low, cross_down, state, risk):
+    """
+    Resting exits for positions carried over from a previous run, scanned over the new bars.
+    A crossover sell already queued on the last bar means the exits were cancelled there.
+    """
+    queued_sells = {int(state['q_ticker'][k]) for k in range(state['q_len'][0]) if state['q_side'][k] < 0}
+    for n in np.flatnonzero(state['pos_size'] > 0):
+        state['exit_bar'][n] = -1
+        if not risk_enabled(risk) or n in queued_sells:
+            continue
+        downs = np.flatnonzero(cross_down[:, n])
+        end = downs[0] if len(downs) else len(open_) - 1
+        state['exit_bar'][n], state['exit_price'][n], state['exit_reason'][n] = scan_exit(
+            open_[:, n], high[:, n], low[:, n], 0, end, state['pos_price'][n], state['peak'][n],
+            int(state['held'][n]), risk)
+
+
+def track_open_positions(high, days, state):
+    """ Highest high and bars held for the positions still open at the end of a run, so a resume can scan on """
+    n_bars = len(days)
+    for n in np.flatnonzero(state['pos_size'] > 0):
+        entry = int(np.searchsorted(days, state['buy_day'][n]))
+        if entry < n_bars and days[entry] == state['buy_day'][n]:
+            state['peak'][n] = high[entry:, n].max()
+            state['held'][n] = n_bars - 1 - entry
+        else:
+            state['peak'][n] = max(state['peak'][n], high[:, n].max())
+            state['held'][n] += n_bars
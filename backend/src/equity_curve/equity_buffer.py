@@ -0,0 +1,77 @@
+# Preallocated per-bar history for strategies: numeric buffers on the hot path, date strings only when persisting
+import numpy as np
+
+# === CONFIGURATION === #
+# Equity and cash stay float64: they are stored already rounded to cents, and float32 can't hold every cent
+# above $131,072 (its spacing there is 1/64). Positions are share counts and fit in int32.
+VALUE_DTYPE = np.float64
+POSITION_DTYPE = np.int32
+BAR_DTYPE = np.int32
+BT_EPOCH_ORDINAL = 719163  # backtrader date2num() of 1970-01-01
+
+
+def feed_calendar(ordinals):
+    """ Epoch days of a backtrader feed's datetime line (date2num floats), e.g. feed_calendar(data.datetime.array) """
+    return np.floor(np.asarray(ordinals, dtype=np.float64)).astype(np.int64) - BT_EPOCH_ORDINAL
+
+
+def days_to_strings(days):
+    """ Epoch days -> 'YYYY-MM-DD' strings, vectorized """
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]').astype(str).tolist()
+
+
+class EquityBuffer:
+    """
+    Equity, cash and position history of one strategy instance in preallocated arrays.
+    Each bar stores its index into the feed's calendar instead of a formatted date; rows for the database are
+    built once by rows(). Sized from the feed length, grows by doubling if more bars arrive than expected.
+    """
+
+    def __init__(self, n_bars, n_positions=0):
+        n_bars = max(int(n_bars), 1)
+        self.bar = np.empty(n_bars, dtype=BAR_DTYPE)
+        self.equity = np.empty(n_bars, dtype=VALUE_DTYPE)
+        self.cash = np.empty(n_bars, dtype=VALUE_DTYPE)
+        self.positions = np.empty((n_bars, n_positions), dtype=POSITION_DTYPE)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        capacity = 2 * len(self.bar)
+        for name in ('bar', 'equity', 'cash', 'positions'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, bar, equity, cash, positions=()):
+        i = self.size
+        if i == len(self.bar):
+            self._grow()
+        self.bar[i] = bar
+        self.equity[i] = equity
+        self.cash[i] = cash
+        if len(positions):
+            self.positions[i] = positions
+        self.size = i + 1
+
+    @property
+    def values(self):
+        """ Recorded equity as a float64 view, ready for compute_equity_metrics() """
+        return self.equity[:self.size]
+
+    def days(self, calendar):
+        """ Epoch day of every recorded bar """
+        return np.asarray(calendar)[self.bar[:self.size]]
+
+    def dates(self, calendar):
+        return days_to_strings(self.days(calendar))
+
+    def rows(self, calendar, label):
+        """ (date, label, equity) tuples for the equity_curve table """
+        return list(zip(self.dates(calendar), [label] * self.size, self.values.tolist()))
+
+    def nbytes(self):
+        return self.bar.nbytes + self.equity.nbytes + self.cash.nbytes + self.positions.nbytes
@@ -1,36 +1,42 @@
-import sqlite3
-import pandas as pd
+import os
+import sys
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'frontend'))
+from chart_data_service import get_equity_series
+from repository.database import DB_PATH
+
 # === CONFIGURATION === #
-DB_PATH = "stock_datas.db"
-EQUITY_TABLE = "equity_curve"
 TICKER = "AAPL"  # Change this if you're using multiple tickers
 
 # === LOAD EQUITY CURVE FROM DATABASE === #
-def load_equity_curve():
-    conn = sqlite3.connect(DB_PATH)
-    query = f"""
-        SELECT date, equity FROM {EQUITY_TABLE}
-        WHERE ticker = ?
-        ORDER BY date ASC
-    """
-    df = pd.read_sql_query(query, conn, params=(TICKER,))
-    conn.close()
-
-    df['date'] = pd.to_datetime(df['date'])
-    return df
+def load_equity_curve(start=None, end=None, max_points=2000):
+    """ Equity at the resolution of the viewport, served from precomputed min/max/last tiles """
+    return get_equity_series(TICKER, start, end, max_points, db_path=DB_PATH)
 
 # === PLOT EQUITY CURVE === #
 def plot_equity(df):
-    plt.figure(figsize=(12, 6))
-    plt.plot(df['date'], df['equity'], linewidth=2, label="Equity")
-    plt.title(f"Equity Curve for {TICKER}", fontsize=16)
-    plt.xlabel("Date")
-    plt.ylabel("Portfolio Value ($)")
-    plt.grid(True)
-    plt.legend()
-    plt.tight_layout()
+    fig, ax = plt.subplots(figsize=(12, 6))
+    line, = ax.plot(df['date'], df['last'], linewidth=2, label="Equity")
+    band = [ax.fill_between(df['date'], df['min'], df['max'], alpha=0.3)]
+
+    def on_xlim_changed(axes):
+        # re-query the tiles for the visible range at one bucket per pixel
+        start, end = (mdates.num2date(x).replace(tzinfo=None) for x in axes.get_xlim())
+        view = load_equity_curve(start, end, max_points=int(axes.bbox.width))
+        line.set_data(view['date'], view['last'])
+        band[0].remove()
+        band[0] = axes.fill_between(view['date'], view['min'], view['max'], alpha=0.3, color=line.get_color())
+
+    ax.callbacks.connect('xlim_changed', on_xlim_changed)
+    ax.set_title(f"Equity Curve for {TICKER}", fontsize=16)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Portfolio Value ($)")
+    ax.grid(True)
+    ax.legend()
+    fig.tight_layout()
     plt.show()
 
 # === MAIN === #
@@ -39,4 +45,4 @@ if __name__ == "__main__":
     if equity_df.empty:
         print("❌ No equity data found. Did you run the backtest?")
     else:
-        plot_equity(equity_df)
\ No newline at end of file
+        plot_equity(equity_df)
@@ -1,13 +1,20 @@
 # Enhanced backtester for multi-asset simulation with unified portfolio
 import backtrader as bt
-import yfinance as yf
 import pandas as pd
-import sqlite3
 import logging
+import os
+import sys
 import time
 from datetime import datetime
 import numpy as np
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics.run_analytics import TRADE_COLUMNS, make_trade_fact, record_run, trade_rows
+from equity_curve.equity_buffer import EquityBuffer, feed_calendar
+from middleware.structured_logging import log_event, setup_logging
+from repository.data_panel import get_panel
+from repository.database import DB_PATH, bulk_insert
+
 # === CONFIGURATION === #
 INITIAL_CASH = 100000
 TICKERS = ['AAPL', 'MSFT', 'GOOGL']
@@ -16,9 +23,9 @@ END_DATE = '2025-01-01'
 MAX_POSITION_WEIGHT = 0.5
 
 # === DATABASE === #
-DB_PATH = "stock_datas.db"
 TRADE_TABLE = "backtestv1"
 EQUITY_TABLE = "equity_curve"
+STRATEGY_NAME = "ma_crossover_portfolio"
 
 # === STRATEGY PARAMETERS === #
 STRATEGY_PARAMS = {
@@ -27,11 +34,13 @@ STRATEGY_PARAMS = {
 }
 
 # === LOGGING === #
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(message)s',
-    handlers=[logging.FileHandler("backtest_log.txt"), logging.StreamHandler()]
+# Handlers are installed by setup_logging() (LOG_MODE=text|json); trade events are rendered off the hot path.
+logger = logging.getLogger("backtest")
+TRADE_CLOSED_MSG = (
+    "{sell_date} | 💰 TRADE CLOSED ({ticker}) | Buy: {buy_date} | Sell: {sell_date} | "
+    "PnL: ${pnl:.2f} | Return: {return_pct:.2f}% | Impact: {impact_pct:.4f}% | Held: {time_held}"
 )
+ORDER_FAILED_MSG = "⚠️ Order failed for {ticker} ({status})"
 
 # === HELPER: POSITION SIZING FUNCTION === #
 def calculate_order_size(price, cash, max_weight=MAX_POSITION_WEIGHT):
@@ -56,7 +65,8 @@ class MovingAverageCrossoverStrategy(bt.Strategy):
         self.buy_price = {}
         self.buy_size = {}
         self.buy_datetime = {}
-        self.equity_curve = []
+        self.equity_curve = EquityBuffer(self.datas[0].buflen(), len(self.datas))
+        self.closed_trades = []
 
         for i, d in enumerate(self.datas):
             self.smas[d._name] = {
@@ -66,9 +76,11 @@ class MovingAverageCrossoverStrategy(bt.Strategy):
             self.orders[d._name] = None
 
     def next(self):
-        date = self.datas[0].datetime.date(0).strftime('%Y-%m-%d')
-        equity = round(self.broker.getvalue(), 2)
-        self.equity_curve.append((date, 'PORTFOLIO', equity))
+        # bar index into the feed's calendar; dates are only formatted when the curve is saved
+        self.equity_curve.append(
+            len(self.datas[0]) - 1, round(self.broker.getvalue(), 2), self.broker.get_cash(),
+            [self.getposition(d).size for d in self.datas],
+        )
 
         for d in self.datas:
             name = d._name
@@ -99,50 +111,45 @@ class MovingAverageCrossoverStrategy(bt.Strategy):
                 self.buy_datetime[name] = data.datetime.datetime(0)
             elif order.issell():
                 sell_price = order.executed.price
-                size = order.executed.size
+                size = abs(order.executed.size)
                 buy_price = self.buy_price.get(name, 0)
                 pnl = round((sell_price - buy_price) * size, 2)
-                if pnl < 0:
-                    trade_return_pct *= -1
-                portfolio_value = self.broker.getvalue()
-                trade_impact_pct = round((pnl / portfolio_value) * 100, 4) if portfolio_value else 0.0
                 cash_balance = round(self.broker.get_cash(), 2)
                 sell_datetime = data.datetime.datetime(0)
-                time_held = str(sell_datetime - self.buy_datetime[name])
-                trade_time_str = sell_datetime.strftime('%Y-%m-%d')
-                buy_time_str = self.buy_datetime[name].strftime('%Y-%m-%d')
-
-                logging.info(
-                    f"{trade_time_str} | \U0001f4b0 TRADE CLOSED ({name}) | Buy: {buy_time_str} | "
-                    f"Sell: {trade_time_str} | PnL: ${pnl:.2f} | Return: {trade_return_pct:.2f}% | "
-                    f"Impact: {trade_impact_pct:.4f}% | Held: {time_held}"
-                )
-
-                try:
-                    conn = sqlite3.connect(DB_PATH)
-                    cursor = conn.cursor()
-                    cursor.execute(f"""
-                        INSERT INTO {TRADE_TABLE} (datetime, ticker, buy_price, sell_price, size, pnl, cash_after_trade, time_held)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (trade_time_str, name, buy_price, sell_price, size, pnl, cash_balance, time_held))
-                    conn.commit()
-                    conn.close()
-                except Exception as e:
-                    logging.error(f"DB error on trade insert: {e}")
+
+                if logger.isEnabledFor(logging.INFO):  # log-only fields are skipped when INFO is off
+                    time_held = str(sell_datetime - self.buy_datetime[name])
+                    trade_time_str = sell_datetime.strftime('%Y-%m-%d')
+                    trade_return_pct = round(((sell_price - buy_price) / buy_price) * 100, 2) if buy_price else 0.0
+                    portfolio_value = self.broker.getvalue()
+                    trade_impact_pct = round((pnl / portfolio_value) * 100, 4) if portfolio_value else 0.0
+                    log_event(
+                        logger, logging.INFO, 'trade_closed', TRADE_CLOSED_MSG,
+                        ticker=name, buy_date=self.buy_datetime[name].strftime('%Y-%m-%d'), sell_date=trade_time_str,
+                        buy_price=buy_price, sell_price=sell_price, size=size, pnl=pnl,
+                        return_pct=trade_return_pct, impact_pct=trade_impact_pct,
+                        time_held=time_held, cash_after_trade=cash_balance,
+                    )
+
+                self.closed_trades.append(make_trade_fact(
+                    name, self.buy_datetime[name], sell_datetime, buy_price, sell_price, size, pnl, cash_balance
+                ))
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            logging.warning(f"⚠️ Order failed for {name}")
+            log_event(
+                logger, logging.WARNING, 'order_failed', ORDER_FAILED_MSG,
+                ticker=name, status=order.getstatusname(),
+            )
         self.orders[name] = None
 
     def stop(self):
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.executemany(f"""
-                INSERT INTO {EQUITY_TABLE} (date, ticker, equity)
-                VALUES (?, ?, ?)
-            """, self.equity_curve)
-            conn.commit()
-            conn.close()
+            bulk_insert(TRADE_TABLE, TRADE_COLUMNS, trade_rows(self.closed_trades), DB_PATH)
+        except Exception as e:
+            logging.error(f"DB error on trade insert: {e}")
+
+        try:
+            bulk_insert(EQUITY_TABLE, ('date', 'ticker', 'equity'),
+                        self.equity_curve.rows(feed_calendar(self.datas[0].datetime.array), 'PORTFOLIO'), DB_PATH)
             logging.info(f"\U0001f4ca Equity curve saved for portfolio")
         except Exception as e:
             logging.error(f"Equity curve DB error: {e}")
@@ -150,7 +157,7 @@ class MovingAverageCrossoverStrategy(bt.Strategy):
         # Performance metrics
         try:
             if len(self.equity_curve) > 1:
-                values = [e[2] for e in self.equity_curve]
+                values = self.equity_curve.values
                 returns = np.diff(values) / values[:-1]
 
                 avg_return = np.mean(returns)
@@ -168,6 +175,23 @@ class MovingAverageCrossoverStrategy(bt.Strategy):
         except Exception as e:
             logging.error(f"Error calculating performance ratios: {e}")
 
+        self.record_analytics()
+
+    def record_analytics(self):
+        try:
+            run_id = record_run(
+                STRATEGY_NAME,
+                {'short_period': self.params.short_period, 'long_period': self.params.long_period},
+                [d._name for d in self.datas],
+                self.equity_curve.dates(feed_calendar(self.datas[0].datetime.array)),
+                self.equity_curve.values,
+                self.closed_trades,
+                db_path=DB_PATH,
+            )
+            logging.info(f"\U0001f5c2 Run #{run_id} recorded in analytics tables")
+        except Exception as e:
+            logging.error(f"Analytics DB error: {e}")
+
 # === BACKTRADER DATA WRAPPER === #
 class PandasYahooData(bt.feeds.PandasData):
     params = (
@@ -181,14 +205,9 @@ class PandasYahooData(bt.feeds.PandasData):
     )
 
 # === FETCH DATA === #
-def fetch_data(ticker, start, end):
-    df = yf.download(ticker, start=start, end=end, progress=False, auto_adjust=False)
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = [col[0] for col in df.columns]
-    df.columns = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
-    df.index = pd.to_datetime(df.index)
-    df.dropna(inplace=True)
-    return df
+def fetch_data(tickers, start, end):
+    """ Shared panel of the universe; only bars missing from the local price store are downloaded """
+    return get_panel(tickers, start, pd.Timestamp(end) - pd.Timedelta(days=1), refresh=True)  # end is exclusive
 
 # === RUN BACKTEST === #
 def run_backtest():
@@ -197,8 +216,9 @@ def run_backtest():
     cerebro.addstrategy(MovingAverageCrossoverStrategy, **STRATEGY_PARAMS)
     cerebro.broker.set_cash(INITIAL_CASH)
 
+    panel = fetch_data(TICKERS, START_DATE, END_DATE)
     for ticker in TICKERS:
-        df = fetch_data(ticker, START_DATE, END_DATE)
+        df = panel.frame(ticker)
         if df.empty:
             logging.warning(f"No data for {ticker}, skipping.")
             continue
@@ -215,7 +235,5 @@ def run_backtest():
 
 # === MAIN === #
 if __name__ == '__main__':
+    setup_logging()
     run_backtest()
-
-
-trade_return_pct
\ No newline at end of file
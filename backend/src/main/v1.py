@@ -1,7 +1,13 @@
+import os
+import sys
+
 import numpy as np
 import pandas as pd
 import yfinance as yf
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.data_panel import get_panel
+
 # List of stock tickers to analyze
 TICKERS = ["AAPL", "MSFT", "GOOGL", "TSLA", "NVDA"]  
 
@@ -12,20 +18,16 @@ VOLUME_FILTER = 1_000_000  # Minimum average daily volume
 MARKET_CAP_FILTER = 5000_000_000  # Minimum market cap ($50B)
 
 
-def fetch_stock_data(ticker):
-    """Fetch historical stock data and fundamental info from Yahoo Finance."""
+def fetch_stock_data(ticker, panel):
+    """Historical bars from the shared panel and fundamental info from Yahoo Finance."""
     try:
-        stock = yf.Ticker(ticker)
-        df = stock.history(start=START_DATE, end=END_DATE, auto_adjust=False)
+        df = panel.frame(ticker)
 
         if df.empty:
             print(f"No data for {ticker}")
             return None, None
 
-        df["Adj Close"] = df.get("Adj Close", df["Close"])  # Ensure 'Adj Close' exists
-        df.dropna(inplace=True)
-
-        return df, stock
+        return df, yf.Ticker(ticker)
     except Exception as e:
         print(f"Error fetching {ticker}: {e}")
         return None, None
@@ -53,10 +55,11 @@ def apply_filters(df, stock):
 
 if __name__ == "__main__":
     screened_stocks = []
+    panel = get_panel(TICKERS, START_DATE, pd.Timestamp(END_DATE) - pd.Timedelta(days=1), refresh=True)
 
     for ticker in TICKERS:
         print(f"Processing {ticker}...")
-        stock_data, stock_info = fetch_stock_data(ticker)
+        stock_data, stock_info = fetch_stock_data(ticker, panel)
 
         if stock_data is not None and stock_info is not None:
             if apply_filters(stock_data, stock_info):
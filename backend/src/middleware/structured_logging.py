@@ -0,0 +1,144 @@
+# Structured, asynchronous logging: records are queued on the hot path and written by a background listener
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+# === CONFIGURATION === #
+LOG_PATH = os.getenv("LOG_PATH", "backtest_log.txt")
+LOG_MODE = os.getenv("LOG_MODE", "text")  # "text" keeps the readable lines, "json" writes one object per line
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 5_000_000))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+
+_listener = None
+
+
+# === MESSAGES === #
+class EventMessage:
+    """
+    A record's msg for a structured event: str.format is only applied when a handler asks for the text
+    (str(msg), e.g. through record.getMessage()), so any formatter renders it, on the listener thread here
+    """
+
+    __slots__ = ('template', 'fields')
+
+    def __init__(self, template, fields):
+        self.template = template
+        self.fields = fields
+
+    def __str__(self):
+        return self.template.format(**self.fields)
+
+    def __repr__(self):
+        return f"EventMessage({self.template!r}, {self.fields!r})"
+
+
+# === FORMATTERS === #
+class EventTextFormatter(logging.Formatter):
+    """ Renders the message alone, structured events through their template """
+
+    def format(self, record):
+        record.message = record.getMessage()
+        text = record.message
+        if record.exc_text:
+            text = f"{text}\n{record.exc_text}"
+        return text
+
+
+class JsonLineFormatter(logging.Formatter):
+    """ One JSON object per line: timestamp, level, event name and the raw structured fields """
+
+    def format(self, record):
+        payload = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': getattr(record, 'event', None),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields is not None:
+            payload.update(fields)
+        else:
+            payload['msg'] = record.getMessage()
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+# === HANDLERS === #
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the listener thread.
+    The stock prepare() renders the message in the caller's thread, which is the cost we want off the hot path.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(mode=LOG_MODE, level=LOG_LEVEL, log_path=LOG_PATH,
+                  max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, console=True):
+    """
+    Route the root logger through a queue to a rotating file (and optionally the console).
+    Safe to call more than once: the previous listener is stopped, its handlers closed, and replaced.
+    """
+    global _listener
+
+    formatter = JsonLineFormatter() if mode == "json" else EventTextFormatter()
+    handlers = [logging.handlers.RotatingFileHandler(
+        log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if _listener is not None:
+        stop_listener(_listener)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_listener(listener):
+    """ Drain the queue, stop the thread and close the handlers so the log file is released """
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def shutdown_logging():
+    """ Flush the queue, stop the listener thread and close its handlers """
+    global _listener
+    if _listener is not None:
+        stop_listener(_listener)
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+# === STRUCTURED EVENTS === #
+def log_event(logger, level, event, template, **fields):
+    """
+    Emit a structured record: the template and fields are queued as an EventMessage and rendered by the
+    listener (text mode) or dumped as JSON; without setup_logging() any standard handler renders the text.
+    The keyword fields are evaluated before the call, so hot-path callers check logger.isEnabledFor(level)
+    first when computing them costs anything.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, EventMessage(template, fields), extra={'event': event, 'fields': fields})
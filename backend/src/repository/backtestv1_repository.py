@@ -1,37 +1,21 @@
-import sqlite3
+import os
+import sys
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.database import DB_PATH, connect
 
-#####ADD COLUMN#####
 
-def connect_db(db_name):
-    """ Helper function to connect to the SQLite database """
-    return sqlite3.connect(db_name)
-
-def add_columns_to_value_infos():
-    """ Add new columns to the 'properties' table """
-    conn = connect_db('evaluation_fonciere.db')  # Replace with your database name
-    cursor = conn.cursor()
-    
-    # Add new columns to the 'properties' table
-    cursor.execute('''
-    ALTER TABLE properties ADD COLUMN NUMBER_ORDER INTEGER;
-    ''')
-
-    conn.commit()
-    conn.close()
-    print("Columns added successfully.")
-
-if __name__ == "__main__":
-    add_columns_to_value_infos()
+def connect_db(db_name=DB_PATH):
+    """ Helper function to connect to the SQLite database (DB_PATH from .env by default) """
+    return connect(db_name)
 
 
 ##########CLEAR DATA################
 
-DB_PATH = "stock_datas.db"
 TABLE_NAME = "equity_curve"
 
 def clear_backtest_table():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cursor = conn.cursor()
 
     cursor.execute(f"DELETE FROM {TABLE_NAME}")
@@ -42,4 +26,3 @@ def clear_backtest_table():
 
 if __name__ == "__main__":
     clear_backtest_table()
-    
\ No newline at end of file
@@ -0,0 +1,270 @@
+# Shared data panel: a universe of bars as (field x date x ticker) arrays on one calendar, cached as memory-mapped files
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from repository.database import DB_PATH, read_frame
+from repository.price_store import PRICE_TABLE, connect_db, refresh_prices, store_versions, stored_range
+
+# === CONFIGURATION === #
+FIELDS = ('Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume')
+COLUMNS = ('open', 'high', 'low', 'close', 'COALESCE(adj_close, close)', 'volume')
+PANEL_DIR = os.getenv("PANEL_DIR", "panels")  # one sub-directory of .npy files per cached universe
+PANEL_MAX_AGE_DAYS = float(os.getenv("PANEL_MAX_AGE_DAYS", 14))  # saved panels unused for longer are deleted
+PANEL_MAX_COUNT = int(os.getenv("PANEL_MAX_COUNT", 32))  # and only the most recently used ones are kept
+STALE_BUSINESS_DAYS = 1  # refresh a ticker whose last stored bar is older than this before `end`
+
+
+class DataPanel:
+    """
+    Bars of a ticker universe on a shared trading calendar (every date at least one ticker traded).
+    `values` is a contiguous float64 (field, date, ticker) array, NaN where a ticker has no bar; `mask` is True
+    where it has one. Field, date-range and ticker lookups return views of the same buffer, so a panel opened
+    from disk with mmap stays on disk until a slice is actually read.
+    """
+
+    def __init__(self, values, mask, days, tickers, fields=FIELDS, meta=None):
+        self.values = values
+        self.mask = mask
+        self.days = days
+        self.tickers = list(tickers)
+        self.fields = list(fields)
+        self.meta = meta or {}
+        self._columns = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    def __len__(self):
+        return len(self.days)
+
+    def __repr__(self):
+        span = f"{self.dates[0]} → {self.dates[-1]}" if len(self) else "empty"
+        return f"DataPanel({len(self.tickers)} tickers x {len(self)} bars, {span})"
+
+    # === LOOKUPS === #
+    @property
+    def dates(self):
+        return self.days.astype('datetime64[D]')
+
+    def field(self, name):
+        """ (date, ticker) view of one field """
+        return self.values[self.fields.index(name)]
+
+    def column(self, ticker):
+        return self._columns[ticker]
+
+    def ticker(self, ticker):
+        """ (field, date) view of one ticker, missing bars included as NaN """
+        return self.values[:, :, self.column(ticker)]
+
+    def bounds(self, start=None, end=None):
+        """ [first, last) bar positions of the dates between `start` and `end` inclusive """
+        first = 0 if start is None else int(np.searchsorted(self.days, to_day(start), side='left'))
+        last = len(self.days) if end is None else int(np.searchsorted(self.days, to_day(end), side='right'))
+        return first, last
+
+    def between(self, start=None, end=None):
+        """ Sub-panel of a date range, sharing the buffers """
+        first, last = self.bounds(start, end)
+        return DataPanel(self.values[:, first:last], self.mask[first:last], self.days[first:last], self.tickers,
+                         self.fields)
+
+    def select(self, tickers):
+        """
+        Sub-panel of some tickers. Shares the buffers when they are adjacent in the panel's order,
+        otherwise the selected columns are copied.
+        """
+        cols = [self.column(ticker) for ticker in tickers]
+        if cols and cols == list(range(cols[0], cols[0] + len(cols))):
+            index = slice(cols[0], cols[0] + len(cols))
+        else:
+            index = cols
+        return DataPanel(self.values[:, :, index], self.mask[:, index], self.days, tickers, self.fields)
+
+    def common(self):
+        """ Only the dates every ticker has a bar for (a copy unless no bar is missing) """
+        rows = self.mask.all(axis=1)
+        if rows.all():
+            return self
+        return DataPanel(self.values[:, rows], self.mask[rows], self.days[rows], self.tickers, self.fields)
+
+    # === PANDAS === #
+    def index(self, rows=slice(None)):
+        return pd.DatetimeIndex(self.dates[rows].astype('datetime64[ns]'))
+
+    def frame(self, ticker):
+        """ fetch_data()-style DataFrame of one ticker's bars (missing bars dropped), e.g. for a backtrader feed """
+        col = self.column(ticker)
+        rows = np.flatnonzero(self.mask[:, col])
+        return pd.DataFrame(self.values[:, rows, col].T, index=self.index(rows), columns=self.fields)
+
+    def to_frame(self, field='Adj Close'):
+        """ One column per ticker of a field over the whole calendar """
+        return pd.DataFrame(self.field(field), index=self.index(), columns=self.tickers)
+
+    # === PERSISTENCE === #
+    def save(self, path, meta=None):
+        """ values / mask / days as .npy next to a meta.json; written to a temporary directory and swapped in """
+        tmp = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, 'values.npy'), np.ascontiguousarray(self.values))
+        np.save(os.path.join(tmp, 'mask.npy'), np.ascontiguousarray(self.mask))
+        np.save(os.path.join(tmp, 'days.npy'), np.ascontiguousarray(self.days))
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'tickers': self.tickers, 'fields': self.fields, **(meta or {})}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def open(cls, path, mmap_mode='r'):
+        """ Panel saved by save(), memory-mapped read-only: nothing is parsed and pages load on first access """
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ('values', 'mask', 'days')]
+        return cls(*arrays, meta['tickers'], meta['fields'], meta)
+
+    # === BUILD === #
+    @classmethod
+    def from_store(cls, tickers, start=None, end=None, db_path=DB_PATH):
+        """ Universe from the local price store in one query, pivoted onto the union of the tickers' dates """
+        tickers = list(tickers)
+        query = f"""
+            SELECT ticker, date, {', '.join(COLUMNS)} FROM {PRICE_TABLE}
+            WHERE ticker IN ({','.join('?' * len(tickers))}) AND date >= ? AND date <= ?
+        """
+        params = [*tickers, day_bound(start, '0000-00-00'), day_bound(end, '9999-99-99')]
+        connect_db(db_path).close()
+        df = read_frame(query, params, db_path)
+
+        days, rows = np.unique(pd.to_datetime(df['date']).values.astype('datetime64[D]').astype(np.int64),
+                               return_inverse=True)
+        cols = pd.Index(tickers).get_indexer(df['ticker'])
+        values = np.full((len(FIELDS), len(days), len(tickers)), np.nan)
+        values[:, rows, cols] = df.iloc[:, 2:].to_numpy(dtype=float).T
+        mask = np.zeros((len(days), len(tickers)), dtype=bool)
+        mask[rows, cols] = True
+        return cls(values, mask, days, tickers)
+
+
+def to_day(value):
+    """ Epoch day of a date-like value """
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64))
+
+
+def day_bound(value, default):
+    return default if value is None else str(pd.Timestamp(value).date())
+
+
+# === SESSION CACHE === #
+def store_fingerprint(tickers, db_path=DB_PATH):
+    """
+    Store version of every ticker: changes when store_prices() adds or revises any of its bars, and is read
+    without scanning them, so checking a saved panel costs one small lookup whatever the universe's size
+    """
+    return store_versions(tickers, db_path)
+
+
+def refresh_stale(tickers, start, end, db_path=DB_PATH):
+    """ Download bars for tickers whose stored history doesn't cover [start, end] yet; failures keep stored bars """
+    end = pd.Timestamp('today').normalize() if end is None else pd.Timestamp(end)
+    stale_before = end.normalize() - pd.offsets.BDay(STALE_BUSINESS_DAYS)
+    for ticker in tickers:
+        first, last = stored_range(ticker, db_path)
+        if first is None or pd.Timestamp(first) > pd.Timestamp(start) + pd.offsets.BDay(5) \
+                or pd.Timestamp(last) < stale_before:
+            try:
+                refresh_prices(ticker, start, end + pd.Timedelta(days=1), db_path)  # yfinance's end is exclusive
+            except Exception as e:
+                print(f"⚠️ Could not refresh {ticker}, using stored prices: {e}")
+
+
+def panel_path(tickers, db_path=DB_PATH):
+    """ PANEL_DIR/<database>_<hash of the universe>: one saved panel per universe, whatever the date range """
+    key = json.dumps([os.path.abspath(db_path), list(tickers)])
+    name = f"{os.path.splitext(os.path.basename(db_path))[0]}_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+    return os.path.join(PANEL_DIR, name)
+
+
+def evict_panels(keep=(), max_age_days=PANEL_MAX_AGE_DAYS, max_count=PANEL_MAX_COUNT):
+    """
+    Delete saved panels unused for `max_age_days` and all but the `max_count` most recently used ones, plus
+    temporary directories left by an interrupted save. Use is tracked by the mtime of meta.json.
+    """
+    if not os.path.isdir(PANEL_DIR):
+        return []
+    now = time.time()
+    keep = {os.path.abspath(path) for path in keep}
+    panels, removed = [], []
+    for name in os.listdir(PANEL_DIR):
+        path = os.path.join(PANEL_DIR, name)
+        if not os.path.isdir(path) or os.path.abspath(path) in keep:
+            continue
+        if '.tmp' in name:
+            if now - os.path.getmtime(path) > 3600:  # younger ones may still be being written
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path)
+            continue
+        try:
+            panels.append((os.path.getmtime(os.path.join(path, 'meta.json')), path))
+        except OSError:
+            continue
+
+    panels.sort(reverse=True)
+    for rank, (used, path) in enumerate(panels):
+        if now - used > max_age_days * 86400 or rank + len(keep) >= max_count:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    return removed
+
+
+_session = {}
+
+
+def get_panel(tickers, start=None, end=None, db_path=DB_PATH, refresh=False):
+    """
+    The panel of a universe between `start` and `end` (inclusive). The whole stored history of the universe is
+    built at most once: kept for the rest of the process and saved under PANEL_DIR, so other processes
+    memory-map it instead of querying and pivoting again, and any date range is a between() view of it.
+    A saved panel is reused only while the price store still holds the same bars for the universe.
+    """
+    tickers = list(tickers)
+    if refresh:
+        refresh_stale(tickers, start, end, db_path)
+    fingerprint = store_fingerprint(tickers, db_path)
+    path = panel_path(tickers, db_path)
+
+    panel = _session.get(path)
+    if panel is None or panel.meta.get('fingerprint') != fingerprint:
+        panel = open_saved(path, fingerprint)
+        if panel is None:
+            panel = DataPanel.from_store(tickers, db_path=db_path)
+            panel.meta['fingerprint'] = fingerprint
+            try:
+                os.makedirs(PANEL_DIR, exist_ok=True)
+                panel.save(path, panel.meta)
+                panel = DataPanel.open(path)
+            except OSError as e:
+                print(f"⚠️ Could not save panel to {path}: {e}")
+            evict_panels(keep=[path])
+        _session[path] = panel
+    return panel.between(start, end)
+
+
+def open_saved(path, fingerprint):
+    """ Saved panel at `path` if it matches the store, marked as used for evict_panels() """
+    try:
+        panel = DataPanel.open(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if panel.meta.get('fingerprint') != fingerprint:
+        return None
+    try:
+        os.utime(os.path.join(path, 'meta.json'))
+    except OSError:
+        pass
+    return panel
@@ -0,0 +1,243 @@
+# Database layer: settings from .env, pooled SQLite (WAL) connections, bulk writes and pluggable read backends
+import os
+import queue
+import sqlite3
+import threading
+
+import pandas as pd
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '.env')
+
+
+def load_env(path=ENV_FILE):
+    """ KEY=VALUE lines from .env into os.environ; variables already set in the environment win """
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            os.environ.setdefault(key.strip(), value.strip().strip('"').strip("'"))
+
+
+load_env()
+
+# === CONFIGURATION === #
+DB_PATH = os.getenv("DB_PATH", "stock_datas.db")
+DB_READ_BACKEND = os.getenv("DB_READ_BACKEND", "sqlite")  # "duckdb" scans the same SQLite file through DuckDB
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", 30))  # seconds a writer waits for the lock before failing
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_BULK_CHUNK = int(os.getenv("DB_BULK_CHUNK", 50_000))
+# Path to a sqlite_scanner.duckdb_extension file. Unset: the one shipped by the duckdb-extension-sqlite-scanner
+# package for the installed DuckDB, else one DuckDB already has installed, else INSTALL sqlite (needs network)
+DUCKDB_SQLITE_EXTENSION = os.getenv("DUCKDB_SQLITE_EXTENSION")
+
+
+# === CONNECTION POOL === #
+class PooledConnection(sqlite3.Connection):
+    """ sqlite3 connection whose close() hands it back to its pool, so existing connect/close call sites pool for free """
+
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Up to `size` idle connections to one SQLite file, opened in WAL mode so readers never block the writer.
+    Writers from other processes wait up to `timeout` seconds for the lock instead of failing immediately.
+    A forked worker starts with an empty pool rather than reusing its parent's connections.
+    """
+
+    def __init__(self, db_path, size=DB_POOL_SIZE, timeout=DB_BUSY_TIMEOUT, journal_mode=DB_JOURNAL_MODE):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.journal_mode = journal_mode
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False, factory=PooledConnection)
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            self._idle = queue.LifoQueue(maxsize=self.size)
+            self._pid = os.getpid()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def release(self, conn):
+        # same as closing a plain connection: uncommitted work is discarded
+        if conn.in_transaction:
+            conn.rollback()
+        if self._pid != os.getpid():
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.really_close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().really_close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(db_path)
+        return _pools[key]
+
+
+def connect(db_path=DB_PATH):
+    """ Pooled drop-in for sqlite3.connect(db_path): close() returns the connection to the pool """
+    return get_pool(db_path).acquire()
+
+
+# === BULK WRITES === #
+def bulk_insert(table, columns, rows, db_path=DB_PATH, conn=None, on_conflict="", chunk_size=DB_BULK_CHUNK):
+    """
+    Insert an iterable of tuples in one transaction per `chunk_size` rows, with a single prepared statement.
+    `on_conflict` is appended to the statement, e.g. "ON CONFLICT (ticker, date) DO UPDATE SET ...".
+    Returns the number of rows written.
+    """
+    sql = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+           f"{on_conflict}")
+    own_conn = conn is None
+    conn = conn or connect(db_path)
+    written = 0
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                conn.executemany(sql, chunk)
+                conn.commit()
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            conn.executemany(sql, chunk)
+            conn.commit()
+            written += len(chunk)
+    finally:
+        if own_conn:
+            conn.close()
+    return written
+
+
+def copy_frame(df, table, columns=None, db_path=DB_PATH, conn=None, on_conflict=""):
+    """
+    COPY-style load of a DataFrame: column arrays are converted to Python values once and zipped into rows,
+    instead of building one tuple per row through itertuples().
+    """
+    columns = list(df.columns) if columns is None else list(columns)
+    rows = zip(*(df[column].tolist() for column in columns))
+    return bulk_insert(table, columns, rows, db_path=db_path, conn=conn, on_conflict=on_conflict)
+
+
+# === READ BACKENDS === #
+class SQLiteReader:
+    """ Analytical reads on a pooled SQLite connection """
+
+    name = "sqlite"
+
+    def read_frame(self, sql, params=(), db_path=DB_PATH):
+        conn = connect(db_path)
+        try:
+            return pd.read_sql_query(sql, conn, params=tuple(params))
+        finally:
+            conn.close()
+
+
+class DuckDBReader:
+    """
+    Analytical reads through DuckDB with the SQLite file attached read-only: columnar, multi-threaded scans and
+    aggregations over the same tables. SQL has to be portable (no SQLite-only functions; `/` is float division).
+    One DuckDB connection per thread and database file.
+    """
+
+    name = "duckdb"
+
+    def __init__(self):
+        import duckdb  # optional dependency, only needed with DB_READ_BACKEND=duckdb
+        self._duckdb = duckdb
+        self._local = threading.local()
+
+    def _connection(self, db_path):
+        connections = self._local.__dict__.setdefault('connections', {})
+        key = os.path.abspath(db_path)
+        if key not in connections:
+            conn = self._duckdb.connect()
+            self._load_sqlite(conn)
+            conn.execute(f"ATTACH '{key}' AS store (TYPE sqlite, READ_ONLY)")
+            conn.execute("USE store")
+            connections[key] = conn
+        return connections[key]
+
+    def _load_sqlite(self, conn):
+        """ Load the sqlite extension without touching the network unless it can't be found locally """
+        path = DUCKDB_SQLITE_EXTENSION or self._packaged_extension()
+        if path:
+            conn.execute(f"LOAD '{path}'")
+            return
+        try:
+            conn.execute("LOAD sqlite")
+        except self._duckdb.Error:
+            conn.execute("INSTALL sqlite")
+            conn.execute("LOAD sqlite")
+
+    def _packaged_extension(self):
+        """ sqlite_scanner from the duckdb-extension-sqlite-scanner wheel, if installed for this DuckDB version """
+        try:
+            import duckdb_extension_sqlite_scanner as package
+        except ImportError:
+            return None
+        path = os.path.join(os.path.dirname(package.__file__), 'extensions', f"v{self._duckdb.__version__}",
+                            'sqlite_scanner.duckdb_extension')
+        return path if os.path.exists(path) else None
+
+    def read_frame(self, sql, params=(), db_path=DB_PATH):
+        return self._connection(db_path).execute(sql, list(params)).df()
+
+
+READ_BACKENDS = {'sqlite': SQLiteReader, 'duckdb': DuckDBReader}
+_readers = {}
+
+
+def get_reader(backend=None):
+    backend = backend or DB_READ_BACKEND
+    if backend not in READ_BACKENDS:
+        raise ValueError(f"Unknown read backend '{backend}', expected one of {tuple(READ_BACKENDS)}")
+    if backend not in _readers:
+        _readers[backend] = READ_BACKENDS[backend]()
+    return _readers[backend]
+
+
+def read_frame(sql, params=(), db_path=DB_PATH, backend=None):
+    """ SELECT into a DataFrame on the configured read backend (DB_READ_BACKEND) """
+    return get_reader(backend).read_frame(sql, params, db_path)
@@ -1,15 +1,19 @@
-import sqlite3
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.database import DB_PATH, connect
 
 
 #####ADD COLUMN#####
 
-def connect_db(db_name):
-    """ Helper function to connect to the SQLite database """
-    return sqlite3.connect(db_name)
+def connect_db(db_name=DB_PATH):
+    """ Helper function to connect to the SQLite database (DB_PATH from .env by default) """
+    return connect(db_name)
 
 def add_columns_to_value_infos():
     """ Add new columns to the 'equity_curve' table """
-    conn = connect_db('stock_datas')  # Replace with your database name
+    conn = connect_db()
     cursor = conn.cursor()
     
     # Add new columns to the 'equity_curve' table
@@ -27,11 +31,10 @@ if __name__ == "__main__":
 
 ########CLEAR DATA############
 
-DB_PATH = "stock_datas.db"
 TABLE_NAME = "equity_curve"
 
 def clear_backtest_table():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cursor = conn.cursor()
 
     cursor.execute(f"DELETE FROM {TABLE_NAME}")
@@ -0,0 +1,171 @@
+# Local price store on the `stocks` table: bars are downloaded once and read back from SQLite afterwards
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+from repository.database import DB_PATH, connect, copy_frame, read_frame
+
+# === CONFIGURATION === #
+PRICE_TABLE = "stocks"
+VERSION_TABLE = "price_versions"  # per ticker, changed by every store_prices() call
+REFRESH_OVERLAP_DAYS = 7  # re-download a few stored days so vendor revisions overwrite them
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {PRICE_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ticker TEXT NOT NULL,
+        date TEXT NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        adj_close REAL,
+        UNIQUE (ticker, date)
+    )
+"""
+
+# Versions are nanosecond timestamps rather than counters, so a deleted and re-created store never repeats one
+VERSION_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+        ticker TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+"""
+
+
+_schema_ready = set()
+
+
+def connect_db(db_path=DB_PATH):
+    """
+    Pooled connection with the stocks table (and its adj_close column) and the version table in place, checked
+    once per process. Tickers stored before versions existed get one when the table is created.
+    """
+    conn = connect(db_path)
+    if db_path not in _schema_ready:
+        conn.execute(SCHEMA)
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({PRICE_TABLE})")]
+        if 'adj_close' not in columns:
+            conn.execute(f"ALTER TABLE {PRICE_TABLE} ADD COLUMN adj_close REAL")
+        conn.execute(VERSION_SCHEMA)
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {VERSION_TABLE} (ticker, version)
+            SELECT DISTINCT ticker, ? FROM {PRICE_TABLE}
+            WHERE NOT EXISTS (SELECT 1 FROM {VERSION_TABLE})
+        """, (time.time_ns(),))
+        conn.commit()
+        _schema_ready.add(db_path)
+    return conn
+
+
+# === READ === #
+def load_prices(ticker, start=None, end=None, db_path=DB_PATH):
+    """ Bars for one ticker with the Open/High/Low/Close/Adj Close/Volume columns of fetch_data() """
+    query = f"SELECT date, open, high, low, close, COALESCE(adj_close, close), volume FROM {PRICE_TABLE} WHERE ticker = ?"
+    params = [ticker]
+    if start is not None:
+        query += " AND date >= ?"
+        params.append(str(start)[:10])
+    if end is not None:
+        query += " AND date <= ?"
+        params.append(str(end)[:10])
+    query += " ORDER BY date"
+
+    connect_db(db_path).close()
+    df = read_frame(query, params, db_path)
+
+    df.index = pd.to_datetime(df.pop('date'))
+    df.columns = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+    return df
+
+
+def stored_range(ticker, db_path=DB_PATH):
+    """ (first, last) stored dates for a ticker, (None, None) when nothing is stored """
+    conn = connect_db(db_path)
+    row = conn.execute(f"SELECT MIN(date), MAX(date) FROM {PRICE_TABLE} WHERE ticker = ?", (ticker,)).fetchone()
+    conn.close()
+    return row
+
+
+def history_fingerprint(ticker, end, db_path=DB_PATH):
+    """ (bars, sum of opens, sum of closes) up to `end`: changes whenever a stored bar is revised, added or removed """
+    conn = connect_db(db_path)
+    row = conn.execute(f"""
+        SELECT COUNT(*), TOTAL(open), TOTAL(close) FROM {PRICE_TABLE}
+        WHERE ticker = ? AND date <= ?
+    """, (ticker, str(end)[:10])).fetchone()
+    conn.close()
+    return list(row)
+
+
+def store_versions(tickers, db_path=DB_PATH):
+    """ Version of each ticker's stored bars (None if never stored): one indexed lookup, no scan of the bars """
+    conn = connect_db(db_path)
+    rows = conn.execute(f"""
+        SELECT ticker, version FROM {VERSION_TABLE} WHERE ticker IN ({','.join('?' * len(tickers))})
+    """, tickers).fetchall()
+    conn.close()
+    found = dict(rows)
+    return [found.get(ticker) for ticker in tickers]
+
+
+# === WRITE === #
+def store_prices(ticker, df, db_path=DB_PATH):
+    """
+    Upsert bars from a fetch_data()-style DataFrame, overwriting revised rows, and move the ticker's version on.
+    Anything else writing to the stocks table has to bump the version the same way for cached panels to notice.
+    """
+    adj_close = df['Adj Close'] if 'Adj Close' in df else df['Close']
+    bars = pd.DataFrame({
+        'ticker': ticker,
+        'date': df.index.strftime('%Y-%m-%d'),
+        'open': df['Open'].to_numpy(dtype=float),
+        'high': df['High'].to_numpy(dtype=float),
+        'low': df['Low'].to_numpy(dtype=float),
+        'close': df['Close'].to_numpy(dtype=float),
+        'volume': df['Volume'].to_numpy(dtype='int64'),
+        'adj_close': adj_close.to_numpy(dtype=float),
+    })
+    conn = connect_db(db_path)
+    try:
+        written = copy_frame(
+            bars, PRICE_TABLE, conn=conn,
+            on_conflict="""
+                ON CONFLICT (ticker, date) DO UPDATE SET
+                    open = excluded.open, high = excluded.high, low = excluded.low,
+                    close = excluded.close, volume = excluded.volume, adj_close = excluded.adj_close
+            """,
+        )
+        conn.execute(f"""
+            INSERT INTO {VERSION_TABLE} (ticker, version) VALUES (?, ?)
+            ON CONFLICT (ticker) DO UPDATE SET version = MAX(version + 1, excluded.version)
+        """, (ticker, time.time_ns()))
+        conn.commit()
+    finally:
+        conn.close()
+    return written
+
+
+def refresh_prices(ticker, start, end=None, db_path=DB_PATH):
+    """
+    Download only the bars after what is already stored (plus a small overlap) and upsert them.
+    When the stored history starts after `start` (beyond a weekend/holiday gap) the whole range is downloaded.
+    """
+    import yfinance as yf
+
+    first, last = stored_range(ticker, db_path)
+    if first is not None and pd.Timestamp(first) <= pd.Timestamp(start) + timedelta(days=REFRESH_OVERLAP_DAYS):
+        start = max(pd.Timestamp(start), pd.Timestamp(last) - timedelta(days=REFRESH_OVERLAP_DAYS))
+
+    df = yf.download(ticker, start=start, end=end, progress=False, auto_adjust=False)
+    if df.empty:
+        return 0
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [col[0] for col in df.columns]
+    if 'Adj Close' not in df:
+        df['Adj Close'] = df['Close']
+    df = df[['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']].dropna()
+    df.index = pd.to_datetime(df.index)
+    return store_prices(ticker, df, db_path)
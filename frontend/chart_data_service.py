@@ -0,0 +1,209 @@
+# Chart data service: multi-resolution equity tiles and locally cached comparison prices for the plots
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', 'src'))
+from repository.database import DB_PATH, bulk_insert, connect, read_frame
+from repository.data_panel import get_panel
+
+# === CONFIGURATION === #
+EQUITY_TABLE = "equity_curve"
+TILE_TABLE = "equity_tiles"
+TILE_META_TABLE = "equity_tile_meta"
+TILE_FANOUT = 4  # each level aggregates 4 buckets of the level below
+MIN_TILE_BUCKETS = 64  # stop building levels once a level is this coarse
+DEFAULT_MAX_POINTS = 2000
+
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {TILE_TABLE} (
+        ticker TEXT NOT NULL,
+        level INTEGER NOT NULL,
+        start_day INTEGER NOT NULL,
+        end_day INTEGER NOT NULL,
+        first REAL,
+        min REAL,
+        max REAL,
+        last REAL,
+        PRIMARY KEY (ticker, level, start_day)
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {TILE_META_TABLE} (
+        ticker TEXT PRIMARY KEY,
+        source_max_id INTEGER NOT NULL,
+        points INTEGER NOT NULL,
+        levels INTEGER NOT NULL,
+        built_at INTEGER NOT NULL
+    )
+    """,
+    f"CREATE INDEX IF NOT EXISTS idx_{EQUITY_TABLE}_ticker_date ON {EQUITY_TABLE} (ticker, date)",
+]
+
+
+_schema_ready = set()
+
+
+def connect_db(db_path=DB_PATH):
+    conn = connect(db_path)
+    if db_path not in _schema_ready:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        _schema_ready.add(db_path)
+    return conn
+
+
+# === DOWNSAMPLING === #
+def bucket_aggregate(days, values, starts):
+    """ first/min/max/last of `values` for buckets beginning at the `starts` positions """
+    ends = np.append(starts[1:], len(values))
+    return pd.DataFrame({
+        'start_day': days[starts],
+        'end_day': days[ends - 1],
+        'first': values[starts],
+        'min': np.minimum.reduceat(values, starts),
+        'max': np.maximum.reduceat(values, starts),
+        'last': values[ends - 1],
+    })
+
+
+def downsample_minmax(index, values, max_points=DEFAULT_MAX_POINTS):
+    """
+    Reduce a series to at most ~max_points plotted points while keeping every peak and trough:
+    each bucket contributes its min and max in time order. Returns (index, values) unchanged if already small.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) <= max_points:
+        return index, values
+    n_buckets = max(max_points // 2, 1)
+    starts = np.linspace(0, len(values), n_buckets, endpoint=False).astype(np.int64)
+    ends = np.append(starts[1:], len(values))
+    positions = []
+    for start, end in zip(starts, ends):
+        window = values[start:end]
+        lo, hi = start + int(np.argmin(window)), start + int(np.argmax(window))
+        positions.extend(sorted({lo, hi}))
+    positions = np.asarray(positions)
+    return index[positions], values[positions]
+
+
+# === EQUITY TILES === #
+def _to_day(value, default):
+    return default if value is None else int(pd.Timestamp(value).to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+
+def _to_date_str(value, default):
+    return default if value is None else pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def load_equity_points(ticker, start=None, end=None, db_path=DB_PATH):
+    """
+    Equity curve of the latest run stored under `ticker`. equity_curve has no run id, but each run writes its
+    rows in date order, so a row dated on or before the previous one starts a new run; an incremental run
+    appending later dates continues the one it resumed. Earlier runs under the same label (e.g. PORTFOLIO from
+    run.py and trenbolone_backtest.py) are never spliced into the curve.
+    """
+    connect_db(db_path).close()
+    df = read_frame(f"""
+        WITH marked AS (
+            SELECT id, date, equity,
+                   CASE WHEN date <= LAG(date) OVER (ORDER BY id) THEN 1 ELSE 0 END AS restart
+            FROM {EQUITY_TABLE} WHERE ticker = ?
+        ), runs AS (
+            SELECT id, date, equity, SUM(restart) OVER (ORDER BY id) AS run FROM marked
+        )
+        SELECT date, equity FROM runs
+        WHERE run = (SELECT MAX(run) FROM runs) AND date >= ? AND date <= ?
+        ORDER BY date ASC
+    """, (ticker, _to_date_str(start, '0000-00-00'), _to_date_str(end, '9999-99-99')), db_path)
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def build_tiles(ticker, db_path=DB_PATH, force=False):
+    """ (Re)build the tile pyramid for a ticker when the equity table has rows the tiles haven't seen """
+    conn = connect_db(db_path)
+    source_max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {EQUITY_TABLE} WHERE ticker = ?",
+                                 (ticker,)).fetchone()[0]
+    meta = conn.execute(f"SELECT source_max_id FROM {TILE_META_TABLE} WHERE ticker = ?", (ticker,)).fetchone()
+    conn.close()
+    if not force and meta is not None and meta[0] == source_max_id:
+        return False
+
+    df = load_equity_points(ticker, db_path=db_path)
+    days = df['date'].values.astype('datetime64[D]').astype(np.int64)
+    values = df['equity'].to_numpy(dtype=float)
+
+    rows = []
+    level, bucket = 1, TILE_FANOUT
+    while len(values) and len(values) / bucket >= MIN_TILE_BUCKETS:
+        tiles = bucket_aggregate(days, values, np.arange(0, len(values), bucket))
+        tiles.insert(0, 'level', level)
+        rows.extend(tiles.itertuples(index=False, name=None))
+        level, bucket = level + 1, bucket * TILE_FANOUT
+
+    conn = connect_db(db_path)
+    conn.execute(f"DELETE FROM {TILE_TABLE} WHERE ticker = ?", (ticker,))
+    bulk_insert(TILE_TABLE, ('ticker', 'level', 'start_day', 'end_day', 'first', 'min', 'max', 'last'),
+                [(ticker, int(lv), int(s), int(e), f, lo, hi, la) for lv, s, e, f, lo, hi, la in rows], conn=conn)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO {TILE_META_TABLE} (ticker, source_max_id, points, levels, built_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (ticker, source_max_id, len(values), level - 1, int(time.time())))
+    conn.commit()
+    conn.close()
+    return True
+
+
+def get_equity_series(ticker, start=None, end=None, max_points=DEFAULT_MAX_POINTS, db_path=DB_PATH):
+    """
+    Equity for the viewport [start, end] at the finest resolution that fits in `max_points` buckets.
+    Columns: date, start_date, first, min, max, last. `date` is the bucket's last day, where `last` was
+    observed, so plotting `last` against it doesn't shift the curve; `start_date` is the bucket's first day
+    (all columns are equal at full resolution).
+    """
+    build_tiles(ticker, db_path)
+    start_day = _to_day(start, -(2 ** 31))
+    end_day = _to_day(end, 2 ** 31)
+
+    conn = connect_db(db_path)
+    levels = conn.execute(f"SELECT levels FROM {TILE_META_TABLE} WHERE ticker = ?", (ticker,)).fetchone()[0]
+    # estimate the visible raw points from the coarsest level, then pick the finest level that fits
+    level = 0
+    if levels:
+        coarse = conn.execute(f"""
+            SELECT COUNT(*) FROM {TILE_TABLE}
+            WHERE ticker = ? AND level = ? AND end_day >= ? AND start_day <= ?
+        """, (ticker, levels, start_day, end_day)).fetchone()[0]
+        visible = coarse * TILE_FANOUT ** levels
+        while level < levels and visible / TILE_FANOUT ** level > max_points:
+            level += 1
+
+    if level == 0:
+        conn.close()
+        df = load_equity_points(ticker, start, end, db_path)
+        return pd.DataFrame({'date': df['date'].values, 'start_date': df['date'].values, 'first': df['equity'].values,
+                             'min': df['equity'].values, 'max': df['equity'].values, 'last': df['equity'].values})
+
+    conn.close()
+    df = read_frame(f"""
+        SELECT start_day, end_day, first, min, max, last FROM {TILE_TABLE}
+        WHERE ticker = ? AND level = ? AND end_day >= ? AND start_day <= ?
+        ORDER BY start_day
+    """, (ticker, level, start_day, end_day), db_path)
+    df.insert(0, 'start_date', pd.to_datetime(df.pop('start_day'), unit='D'))
+    df.insert(0, 'date', pd.to_datetime(df.pop('end_day'), unit='D'))
+    return df
+
+
+# === COMPARISON PRICES === #
+def load_comparison_prices(tickers, start, end, field='Adj Close', db_path=DB_PATH, refresh=True):
+    """ One column per ticker from the shared price panel, downloading only bars that aren't stored yet """
+    panel = get_panel(tickers, start, end, db_path=db_path, refresh=refresh)
+    df = panel.to_frame(field)
+    return df.loc[:, panel.mask.any(axis=0)]
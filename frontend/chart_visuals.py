@@ -1,21 +1,16 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import yfinance as yf
+
+from chart_data_service import downsample_minmax, load_comparison_prices
 
 # Define parameters
 tickers = ["RGC", "JYD", "WGRX", "TOI","NVDA", "PLTR", "CRWD","MSTR", "MU"]  # Add more tickers as needed
 start_date = pd.to_datetime("today") - pd.DateOffset(days=2000)
 end_date = pd.to_datetime("today")
 
-# Download stock data with auto_adjust=False
-df = yf.download(tickers, start=start_date, end=end_date, auto_adjust=False)
-
-# Use "Adj Close" if available, otherwise use "Close"
-if "Adj Close" in df:
-    df = df["Adj Close"]
-else:
-    df = df["Close"]
+# Load "Adj Close" from the local price store (only bars not stored yet are downloaded)
+df = load_comparison_prices(tickers, start_date, end_date)
 
 # Convert prices to daily percentage change
 df = df.pct_change() * 100  # Convert to daily percentage change
@@ -35,11 +30,14 @@ plt.style.use("dark_background")
 # Create a color palette
 palette = plt.get_cmap("Set1")
 
-# Plot multiple stock tickers (cumulative percentage change)
+# Plot multiple stock tickers (cumulative percentage change), downsampled to the figure width
+max_points = int(plt.gcf().get_size_inches()[0] * plt.gcf().dpi)
 num = 0
 for column in df.drop("Year", axis=1):
     num += 1
-    plt.plot(df.index, df[column], marker="", color=palette(num), linewidth=1, alpha=0.9, label=column)
+    series = df[column].dropna()
+    x, y = downsample_minmax(series.index, series.values, max_points)
+    plt.plot(x, y, marker="", color=palette(num), linewidth=1, alpha=0.9, label=column)
 
 # Format x-axis to show only distinct years
 plt.xticks(ticks=pd.date_range(start=df.index.min(), end=df.index.max(), freq="YS"), 